@@ -0,0 +1,62 @@
+"""
+Memory report for the in-memory representation of RedditDataset comments.
+
+Compares a list of dicts (the original representation) with the column-wise ColumnarComments
+on a synthetic corpus. Runs offline.
+
+    python benchmarks/memory_report.py --comments 200000
+"""
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'reddit_scraper'))
+
+from columnar import ColumnarComments
+from synthetic_data import generate_comments
+
+
+def measure(build):
+    """
+    :param build: function that builds a representation
+    :return: (representation, bytes allocated by it that are still alive)
+    """
+
+    tracemalloc.start()
+    representation = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return representation, size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--comments', type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    def build_dicts():
+        # the csv module returns every field as a new string
+        return [{field: str(value) if field != 'score' else value
+                 for field, value in comment.items()}
+                for comment in generate_comments(args.comments)]
+
+    def build_columnar():
+        return ColumnarComments.from_rows(
+            {field: str(value) for field, value in comment.items()}
+            for comment in generate_comments(args.comments))
+
+    dicts, dicts_size = measure(build_dicts)
+    columnar, columnar_size = measure(build_columnar)
+    assert [dict(comment) for comment in columnar] == dicts
+
+    print(f'{args.comments} comments')
+    print(f'list of dicts:     {dicts_size / 2 ** 20:8.1f} MiB '
+          f'({dicts_size / args.comments:6.0f} bytes per comment)')
+    print(f'ColumnarComments:  {columnar_size / 2 ** 20:8.1f} MiB '
+          f'({columnar_size / args.comments:6.0f} bytes per comment, '
+          f'{dicts_size / columnar_size:.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    main()
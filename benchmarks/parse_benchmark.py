@@ -0,0 +1,108 @@
+"""
+Micro-benchmark for RedditScraper._parse_documents.
+
+Compares the batched parse path against the original per-row implementation on a synthetic
+pushshift.io response and checks that both produce identical rows. Runs offline.
+
+    python benchmarks/parse_benchmark.py --documents 20000
+"""
+import argparse
+import contextlib
+import html
+import io
+import json
+import random
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'reddit_scraper'))
+
+from reddit_scraper import RedditScraper
+
+
+def generate_response(number_of_documents, seed=0):
+    """
+    Generates a pushshift.io response with comments spread over one day
+
+    :param number_of_documents: int
+    :param seed: int
+    :return: bytes
+    """
+
+    rng = random.Random(seed)
+    start = int(datetime(2020, 3, 15).timestamp())
+    words = ['virus', 'mask', 'lockdown', 'testing', 'cases', 'the', 'and', 'we', 'are', 'not',
+             'going', 'to', 'hospital', 'vaccine', '&amp;', 'New York', 'quarantine', 'it&#39;s']
+    documents = []
+    for i in range(number_of_documents):
+        documents.append({
+            'id': f'c{i}',
+            'created_utc': start + rng.randrange(24 * 60 * 60),
+            'author': f'user_{rng.randrange(number_of_documents // 5 + 1)}',
+            'subreddit': 'Coronavirus',
+            'score': int(rng.paretovariate(1.2)),
+            'permalink': f'/r/Coronavirus/comments/abc/title/c{i}/',
+            'body': ' '.join(rng.choice(words) for _ in range(rng.randint(3, 60))),
+        })
+    return json.dumps({'data': documents}).encode('utf-8')
+
+
+def parse_documents_reference(response):
+    """
+    The per-row parse path as it was before the batched implementation
+    """
+
+    documents = []
+    for doc_raw in json.loads(response.decode('utf-8'))['data']:
+
+        timestamp = doc_raw['created_utc']
+        datetime_utc = datetime.utcfromtimestamp(timestamp)
+        datetime_est = datetime_utc.replace(tzinfo=timezone.utc).astimezone(tz=None)
+        date_str = datetime_est.strftime('%Y-%m-%d')
+
+        if 'permalink' in doc_raw:
+            url = f'https://www.reddit.com{doc_raw["permalink"]}'
+        else:
+            url = 'n/a'
+
+        documents.append({
+            'date': date_str,
+            'author': doc_raw['author'],
+            'subreddit': doc_raw['subreddit'],
+            'score': doc_raw['score'],
+            'url': url,
+            'text': html.unescape(doc_raw['body']),
+        })
+    return documents
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--documents', type=int, default=20000)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    response = generate_response(args.documents)
+    scraper = RedditScraper()
+
+    def parse_batched():
+        return list(scraper._parse_documents(response))
+
+    def parse_reference():
+        return parse_documents_reference(response)
+
+    # _parse_documents prints the number of documents of every response
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert parse_batched() == parse_reference(), 'batched parse path changed the rows'
+        reference = min(timeit.repeat(parse_reference, number=1, repeat=args.repeat))
+        batched = min(timeit.repeat(parse_batched, number=1, repeat=args.repeat))
+
+    print(f'{args.documents} documents')
+    print(f'reference: {reference * 1000:8.1f} ms')
+    print(f'batched:   {batched * 1000:8.1f} ms  ({reference / batched:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Benchmark suite for loading, querying, parsing and storing. Runs offline on synthetic data and
+writes the results as json, so that runs before and after a change can be compared.
+
+    python benchmarks/run_benchmarks.py --rows 10000 1000000 --output results.json
+
+Every benchmark is run --repeat times and reports the fastest and the median run. The datasets
+are written to a temporary directory that is deleted afterwards. Benchmarks whose dependencies
+are missing, e.g. store_tweets_to_csv without tweepy, are reported as skipped.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'reddit_scraper'))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'twitter_scraper'))
+
+from columnar import get_sidecar_dir
+from dataset import RedditDataset
+from parse_benchmark import generate_response
+from query_cache import QueryCache
+from reddit_scraper import RedditScraper
+from response_cache import ResponseCache
+from synthetic_data import generate_tweets, write_csv
+
+# get_data_sample queries, from a single week up to the whole date range
+QUERIES = {
+    'week_random': dict(start_date='2020-03-01', end_date='2020-03-07', seed=0),
+    'week_score': dict(start_date='2020-03-01', end_date='2020-03-07', select_by='score'),
+    'all_random': dict(start_date='2020-01-01', end_date='2020-04-30', seed=0),
+    'all_score': dict(start_date='2020-01-01', end_date='2020-04-30', select_by='score'),
+    'terms_random': dict(must_include_terms=['mask'], must_exclude_terms=['trump'], seed=0),
+    'terms_score': dict(must_include_terms=['cuomo', 'new', 'york'], select_by='score'),
+}
+# get_data_samples compares these terms over the whole date range in one batch
+BATCH_TERMS = ['mask', 'trump', 'cuomo', 'new', 'york', 'vaccine', 'test', 'home']
+NUMBER_OF_COMMENTS = 1000
+DOCUMENTS_PER_RESPONSE = 1000
+# parsing and storing are linear, so they are run on at most this many rows
+MAX_PARSED_DOCUMENTS = 200000
+MAX_STORED_TWEETS = 1000000
+
+
+@contextlib.contextmanager
+def working_directory(directory):
+    previous_directory = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(previous_directory)
+
+
+def measure(function, repeat, setup=None):
+    """
+    :param function: function to time
+    :param repeat: int, number of runs
+    :param setup: function that is called before every run and is not timed
+    :return: dict with the fastest and the median run in seconds
+    """
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'min_seconds': min(times), 'median_seconds': statistics.median(times),
+            'repeat': repeat}
+
+
+def benchmark_dataset(number_of_rows, repeat):
+    """
+    Times loading a dataset through its columnar sidecar (built and mapped) and directly from
+    the csv, building the term index, get_data_sample for every query in QUERIES, a batch of
+    term queries with get_data_samples and a repeated query that is answered by the query cache
+
+    :param number_of_rows: int
+    :param repeat: int
+    :return: dict, benchmark name -> result
+    """
+
+    dataset_csv_file = f'synthetic_{number_of_rows}.csv'
+    csv_path = Path('reddit_data', dataset_csv_file)
+    write_csv(csv_path, number_of_rows)
+    sidecar_dir = get_sidecar_dir(csv_path)
+
+    def remove_sidecar():
+        shutil.rmtree(sidecar_dir, ignore_errors=True)
+
+    results = {}
+    remove_sidecar()
+    dataset = RedditDataset(dataset_csv_file)
+    results['load_corona_data_build_sidecar'] = measure(
+        lambda: dataset.load_corona_data(dataset_csv_file), repeat, setup=remove_sidecar)
+    # every repetition of a query has to search again instead of hitting the query cache
+    dataset = RedditDataset(dataset_csv_file, query_cache_size=0)
+    results['load_corona_data_mapped'] = measure(
+        lambda: dataset.load_corona_data(dataset_csv_file), repeat)
+    csv_dataset = RedditDataset(dataset_csv_file, use_columnar_cache=False)
+    results['load_corona_data_csv'] = measure(
+        lambda: csv_dataset.load_corona_data(dataset_csv_file), repeat)
+    del csv_dataset
+
+    def remove_term_index():
+        dataset._term_index = None
+        shutil.rmtree(sidecar_dir / 'term_index', ignore_errors=True)
+
+    results['build_term_index'] = measure(dataset.get_term_index, repeat,
+                                          setup=remove_term_index)
+    dataset.get_term_index()
+    for name, query in QUERIES.items():
+        results[f'get_data_sample_{name}'] = measure(
+            lambda: dataset.get_data_sample(number_of_comments=NUMBER_OF_COMMENTS, **query),
+            repeat)
+
+    batch = [dict(must_include_terms=[term], select_by='score',
+                  number_of_comments=NUMBER_OF_COMMENTS) for term in BATCH_TERMS]
+    results['get_data_samples_terms'] = measure(lambda: dataset.get_data_samples(batch), repeat)
+
+    dataset.query_cache = QueryCache()
+    query = QUERIES['terms_score']
+    dataset.get_data_sample(number_of_comments=NUMBER_OF_COMMENTS, **query)
+    results['get_data_sample_cached'] = measure(
+        lambda: dataset.get_data_sample(number_of_comments=NUMBER_OF_COMMENTS, **query), repeat)
+    return results
+
+
+def benchmark_parsing(number_of_rows, repeat):
+    """
+    Times RedditScraper._get_documents on synthetic pushshift.io responses that are replayed
+    from an offline response cache, so the cache lookup and decompression are included
+
+    :param number_of_rows: int
+    :param repeat: int
+    :return: dict, benchmark name -> result
+    """
+
+    number_of_documents = min(number_of_rows, MAX_PARSED_DOCUMENTS)
+    cache = ResponseCache('fixture_cache', offline=True)
+    scraper = RedditScraper(subreddit='Coronavirus', response_cache=cache)
+    urls = []
+    for i in range(0, number_of_documents, DOCUMENTS_PER_RESPONSE):
+        url = f'{scraper.base_url}/reddit/search/comment/?fixture={i}'
+        cache.put(url, generate_response(min(DOCUMENTS_PER_RESPONSE, number_of_documents - i),
+                                         seed=i))
+        urls.append(url)
+
+    def parse():
+        for url in urls:
+            for _ in scraper._get_documents(url):
+                pass
+
+    result = measure(parse, repeat)
+    result['documents'] = number_of_documents
+    return {'get_documents': result}
+
+
+def benchmark_storing_tweets(number_of_rows, repeat):
+    """
+    Times store_tweets_to_csv
+
+    :param number_of_rows: int
+    :param repeat: int
+    :return: dict, benchmark name -> result
+    """
+
+    try:
+        from twitter_scraper import store_tweets_to_csv
+    except ImportError as e:
+        return {'store_tweets_to_csv': {'skipped': f'twitter_scraper can not be imported: {e}'}}
+
+    tweets = list(generate_tweets(min(number_of_rows, MAX_STORED_TWEETS)))
+    result = measure(lambda: store_tweets_to_csv(tweets, 'tweets.csv'), repeat)
+    result['tweets'] = len(tweets)
+    return {'store_tweets_to_csv': result}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+                            help='dataset sizes, e.g. 10000 1000000 10000000')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--output', help='json file for the results. Default: stdout')
+    args = arg_parser.parse_args()
+
+    report = {
+        'started': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory, working_directory(directory):
+        # RedditDataset reads from the reddit_data folder of the working directory
+        Path('reddit_data').mkdir()
+        # everything the benchmarked code prints goes to stderr, so stdout stays valid json
+        with contextlib.redirect_stdout(sys.stderr):
+            for number_of_rows in args.rows:
+                results = {}
+                results.update(benchmark_dataset(number_of_rows, args.repeat))
+                results.update(benchmark_parsing(number_of_rows, args.repeat))
+                results.update(benchmark_storing_tweets(number_of_rows, args.repeat))
+                report['results'][str(number_of_rows)] = results
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Synthetic reddit comments for benchmarks, so that they run without scraped data or network.
+"""
+import bisect
+import csv
+import itertools
+import math
+import random
+from datetime import date, datetime, timedelta
+
+FIELDNAMES = ['date', 'author', 'subreddit', 'score', 'url', 'text']
+
+WORDS = ('the to and a of is in that it i you this for are not be was on have they with but '
+         'people virus coronavirus covid cases testing test mask masks lockdown quarantine '
+         'hospital deaths death rate flu china wuhan trump cuomo vaccine new york italy '
+         'washington spread symptoms immune social distancing government economy stay home '
+         'positive negative doctors nurses ventilators pandemic outbreak data numbers').split()
+SUBREDDITS = ['Coronavirus', 'COVID19', 'China_Flu', 'CoronavirusUS', 'nCoV']
+
+# word frequencies follow Zipf's law, so a few words are in most comments and most words are rare
+WORD_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+SUBREDDIT_WEIGHTS = list(itertools.accumulate([50, 25, 12, 8, 5]))
+
+
+def generate_comments(number_of_comments, seed=0, start_date=date(2020, 1, 1), days=120):
+    """
+    Yields comments with the fields of a reddit_scraper.py csv, sorted by date.
+
+    The distributions resemble scraped comments: the number of comments per day grows
+    exponentially over the date range, comment lengths are log-normal, words are Zipf
+    distributed, scores are Pareto distributed and a few subreddits and authors write most
+    comments.
+
+    :param number_of_comments: int
+    :param seed: int
+    :param start_date: date
+    :param days: int, number of days the comments are spread over
+    :return: generator of dict
+    """
+
+    rng = random.Random(seed)
+    number_of_authors = number_of_comments // 10 + 1
+    # the last day has about 50 times as many comments as the first one
+    day_weights = list(itertools.accumulate(math.exp(4 * day / days) for day in range(days)))
+    for i in range(number_of_comments):
+        day = start_date + timedelta(
+            days=bisect.bisect_right(day_weights, i / number_of_comments * day_weights[-1]))
+        length = min(int(rng.lognormvariate(2.8, 0.8)) + 1, 300)
+        text = ' '.join(rng.choices(WORDS, cum_weights=WORD_WEIGHTS, k=length))
+        yield {
+            'date': day.isoformat(),
+            'author': f'user_{int(rng.paretovariate(1.0)) % number_of_authors}',
+            'subreddit': rng.choices(SUBREDDITS, cum_weights=SUBREDDIT_WEIGHTS)[0],
+            'score': int(rng.paretovariate(1.2)),
+            'url': f'https://www.reddit.com/r/Coronavirus/comments/abc/title/c{i}/',
+            'text': text,
+        }
+
+
+def write_csv(path, number_of_comments, seed=0):
+    """
+    Writes synthetic comments to a csv in the format written by reddit_scraper.py
+
+    :param path: str or Path
+    :param number_of_comments: int
+    :param seed: int
+    :return:
+    """
+
+    with open(path, 'w') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for comment in generate_comments(number_of_comments, seed=seed):
+            writer.writerow(comment)
+
+
+def generate_tweets(number_of_tweets, seed=0, start_date=date(2016, 9, 6), days=10):
+    """
+    Yields tweet dicts like twitter_scraper.tweet_to_dict
+
+    :param number_of_tweets: int
+    :param seed: int
+    :param start_date: date
+    :param days: int
+    :return: generator of dict
+    """
+
+    rng = random.Random(seed)
+    start = datetime(start_date.year, start_date.month, start_date.day)
+    for i in range(number_of_tweets):
+        created_at = start + timedelta(seconds=i * days * 24 * 60 * 60 // number_of_tweets)
+        author_id = int(rng.paretovariate(1.0)) % (number_of_tweets // 5 + 1)
+        length = min(int(rng.lognormvariate(2.3, 0.5)) + 1, 50)
+        yield {
+            'tweet_id': str(780000000000000000 + i),
+            'date': created_at.date().isoformat(),
+            'author_id': str(author_id),
+            'author_name': f'Name {author_id}',
+            'author_screen_name': f'user_{author_id}',
+            'is_retweet': str(rng.random() < 0.3),
+            'retweets_number': str(int(rng.paretovariate(1.1)) - 1),
+            'text': ' '.join(rng.choices(WORDS, cum_weights=WORD_WEIGHTS, k=length)),
+        }
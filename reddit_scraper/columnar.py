@@ -0,0 +1,690 @@
+import bisect
+import csv
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import shutil
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+
+# bump whenever the layout of the sidecar changes so that old sidecars get rebuilt
+FORMAT_VERSION = 5
+
+FIELDNAMES = ['date', 'author', 'subreddit', 'score', 'url', 'text']
+# columns with few distinct values, stored as codes into a table of distinct values
+CATEGORICAL_COLUMNS = ['author', 'subreddit']
+# columns where (nearly) every value is unique
+STRING_COLUMNS = ['url', 'text']
+
+
+class Comment(Mapping):
+    """
+    A single comment. Behaves like a read-only dict with the keys 'date', 'author', 'subreddit',
+    'score', 'url' and 'text', so comment['text'] and dict(comment) work as before, but uses
+    __slots__ instead of a per-comment dict. Comments are immutable, so cached query results
+    can be shared between callers.
+    """
+
+    __slots__ = tuple(FIELDNAMES)
+
+    def __init__(self, date, author, subreddit, score, url, text):
+        set_attribute = object.__setattr__
+        set_attribute(self, 'date', date)
+        set_attribute(self, 'author', author)
+        set_attribute(self, 'subreddit', subreddit)
+        set_attribute(self, 'score', score)
+        set_attribute(self, 'url', url)
+        set_attribute(self, 'text', text)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Comment is read-only, can't set {name}.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Comment is read-only, can't delete {name}.")
+
+    def to_dict(self):
+        """
+        :return: dict, a plain, mutable copy of the comment, e.g. to serialize it as json
+        """
+
+        return {'date': self.date, 'author': self.author, 'subreddit': self.subreddit,
+                'score': self.score, 'url': self.url, 'text': self.text}
+
+    def __reduce__(self):
+        # the default pickle protocol sets the slots with setattr
+        return Comment, (self.date, self.author, self.subreddit, self.score, self.url, self.text)
+
+    def __getitem__(self, key):
+        if key not in FIELDNAMES:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(FIELDNAMES)
+
+    def __len__(self):
+        return len(FIELDNAMES)
+
+    def __repr__(self):
+        return f'Comment({dict(self)!r})'
+
+
+class StringColumn:
+
+    def __init__(self, offsets, blob):
+        """
+        Strings stored as one utf-8 blob plus an array of offsets, so string i is
+        blob[offsets[i]:offsets[i + 1]]. Strings are only decoded when they are accessed.
+
+        :param offsets: int64 array with len(strings) + 1 entries
+        :param blob: bytes or memoryview
+        """
+
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def extend(self, strings):
+        """
+        Appends strings to a column held in memory
+
+        :param strings: iterable of str
+        :return:
+        """
+
+        if not isinstance(self.blob, bytearray):
+            self.blob = bytearray(self.blob)
+        for string in strings:
+            self.blob += string.encode('utf-8')
+            self.offsets.append(len(self.blob))
+
+    @classmethod
+    def from_strings(cls, strings):
+        offsets = array('q', [0])
+        blob = bytearray()
+        for string in strings:
+            blob += string.encode('utf-8')
+            offsets.append(len(blob))
+        return cls(offsets, bytes(blob))
+
+
+class ColumnarComments:
+
+    def __init__(self, dates, date_codes, date_offsets, scores, word_counts, categorical_columns,
+                 string_columns, mmaps=None, sidecar_dir=None, meta=None):
+        """
+        Comments of a dataset stored column by column (struct of arrays), sorted by date.
+
+        Instead of a dict with six strings per comment, there is one compact array per column:
+        - dates, authors and subreddits repeat a lot and are stored as int32 codes into a table
+          of distinct values, so every distinct value is only stored once
+        - scores are an int64 array
+        - word_counts holds the number of whitespace separated words of every text, computed
+          once when the columns are built
+        - urls and texts are StringColumns
+        The columns are either held in memory or are memoryviews of memory-mapped sidecar
+        files, see load_columnar_comments.
+
+        Since the comments are sorted by date, date_offsets doubles as a date index: the comments
+        of dates[code] are rows date_offsets[code] up to date_offsets[code + 1]. A date range
+        therefore maps to a row range with two bisects, see get_row_range.
+
+        Indexing returns a Comment, which can be used like the dicts of csv.DictReader.
+
+        :param dates: list[str], sorted distinct dates
+        :param date_codes: int32 array, index into dates for every comment
+        :param date_offsets: int64 array, first row of every date, plus the number of rows
+        :param scores: int64 array
+        :param word_counts: int32 array, len(text.split()) for every comment
+        :param categorical_columns: dict, column name -> (int32 codes array, StringColumn of
+                                    distinct values)
+        :param string_columns: dict, column name -> StringColumn
+        :param mmaps: list of mmap objects backing the columns, kept open while in use
+        :param sidecar_dir: Path, directory the columns were loaded from. None if in memory
+        :param meta: dict, contents of the sidecar's meta.json. Empty if in memory
+        """
+
+        self.dates = dates
+        self.date_codes = date_codes
+        self.date_offsets = date_offsets
+        self.scores = scores
+        self.word_counts = word_counts
+        self.categorical_columns = categorical_columns
+        self.string_columns = string_columns
+        self._mmaps = mmaps or []
+        self.sidecar_dir = sidecar_dir
+        self.meta = meta or {}
+        self._category_codes = {}
+
+    def __len__(self):
+        return len(self.date_codes)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('comment index out of range')
+        return Comment(
+            date=self.dates[self.date_codes[i]],
+            author=self.get_string('author', i),
+            subreddit=self.get_string('subreddit', i),
+            score=self.scores[i],
+            url=self.get_string('url', i),
+            text=self.get_string('text', i),
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_date_code_range(self, start_date=None, end_date=None):
+        """
+        Returns the codes of all dates from start_date up to and including end_date.
+        Costs O(log(number of dates)).
+
+        :param start_date: str, e.g. '2020-03-01'. default: first date
+        :param end_date: str, e.g. '2020-03-31'. default: last date
+        :return: (int, int), first code and one past the last code
+        """
+
+        first_code = 0 if start_date is None else bisect.bisect_left(self.dates, start_date)
+        end_code = len(self.dates) if end_date is None else \
+            bisect.bisect_right(self.dates, end_date)
+        return first_code, max(first_code, end_code)
+
+    def get_row_range(self, start_date, end_date):
+        """
+        Returns the rows of all comments posted from start_date up to and including end_date.
+        Costs O(log(number of dates)).
+
+        :param start_date: str, e.g. '2020-03-01'
+        :param end_date: str, e.g. '2020-03-31'
+        :return: (int, int), first row and one past the last row
+        """
+
+        first_code, end_code = self.get_date_code_range(start_date, end_date)
+        return self.date_offsets[first_code], self.date_offsets[end_code]
+
+    def count_by_date(self, start_date=None, end_date=None):
+        """
+        Counts the comments of every date from the date index, without touching the comments.
+
+        :param start_date: str, default: first date
+        :param end_date: str, default: last date
+        :return: dict, date -> number of comments, sorted by date
+        """
+
+        first_code, end_code = self.get_date_code_range(start_date, end_date)
+        offsets = self.date_offsets
+        return {self.dates[code]: offsets[code + 1] - offsets[code]
+                for code in range(first_code, end_code)}
+
+    def get_category_code(self, column, value):
+        """
+        Returns the code of value in a categorical column, e.g. of a subreddit
+
+        :param column: str, e.g. 'subreddit'
+        :param value: str, e.g. 'Coronavirus'
+        :return: int or None if no comment has that value
+        """
+
+        return self._get_code_by_value(column).get(value)
+
+    def _get_code_by_value(self, column):
+        if column not in self._category_codes:
+            _, values = self.categorical_columns[column]
+            self._category_codes[column] = {values[code]: code for code in range(len(values))}
+        return self._category_codes[column]
+
+    def filter_by_word_count(self, rows, minimum_number_of_words):
+        """
+        Keeps the rows whose text has at least minimum_number_of_words words. Compares the
+        precomputed word counts with itertools.compress, so the loop runs in C.
+
+        :param rows: range or iterable of int
+        :param minimum_number_of_words: int
+        :return: iterable of int
+        """
+
+        if minimum_number_of_words <= 0:
+            return rows
+        if isinstance(rows, range) and rows.step == 1:
+            word_counts = self.word_counts[rows.start:rows.stop]
+        else:
+            rows, rows_to_count = itertools.tee(rows)
+            word_counts = map(self.word_counts.__getitem__, rows_to_count)
+        return itertools.compress(rows, map(minimum_number_of_words.__le__, word_counts))
+
+    def get_date(self, i):
+        return self.dates[self.date_codes[i]]
+
+    def get_text(self, i):
+        return self.string_columns['text'][i]
+
+    def get_string(self, column, i):
+        if column in self.categorical_columns:
+            codes, values = self.categorical_columns[column]
+            return values[codes[i]]
+        return self.string_columns[column][i]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the columns from dicts with the csv fields. Rows are sorted by date; rows with
+        the same date keep their order.
+
+        :param rows: iterable of dicts
+        :return: ColumnarComments
+        """
+
+        columns = {field: [] for field in FIELDNAMES}
+        for row in rows:
+            for field in FIELDNAMES:
+                columns[field].append(row[field])
+
+        row_dates = columns['date']
+        if any(row_dates[i] > row_dates[i + 1] for i in range(len(row_dates) - 1)):
+            order = sorted(range(len(row_dates)), key=row_dates.__getitem__)
+            columns = {field: [values[i] for i in order] for field, values in columns.items()}
+
+        dates = sorted(set(columns['date']))
+        date_code_by_date = {d: code for code, d in enumerate(dates)}
+        date_codes = array('i', (date_code_by_date[d] for d in columns['date']))
+        date_offsets = build_date_offsets(date_codes, len(dates))
+        scores = array('q', (int(score) for score in columns['score']))
+        word_counts = array('i', (len(text.split()) for text in columns['text']))
+
+        categorical_columns = {}
+        for column in CATEGORICAL_COLUMNS:
+            code_by_value = {}
+            codes = array('i', (code_by_value.setdefault(value, len(code_by_value))
+                                for value in columns[column]))
+            categorical_columns[column] = (codes, StringColumn.from_strings(code_by_value))
+
+        string_columns = {column: StringColumn.from_strings(columns[column])
+                          for column in STRING_COLUMNS}
+
+        return cls(dates, date_codes, date_offsets, scores, word_counts, categorical_columns,
+                   string_columns)
+
+    def save(self, sidecar_dir, meta):
+        """
+        Writes all columns to sidecar_dir. The columns are written to a temporary directory
+        that replaces sidecar_dir at the end, so readers never see a half written sidecar.
+
+        :param sidecar_dir: Path
+        :param meta: dict, extra information stored in meta.json, e.g. the csv's size and mtime
+        :return:
+        """
+
+        tmp_dir = sidecar_dir.with_name(f'{sidecar_dir.name}.{os.getpid()}.tmp')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        with open(tmp_dir / 'date_codes.i32', 'wb') as outfile:
+            outfile.write(memoryview(self.date_codes).cast('B'))
+        with open(tmp_dir / 'date_offsets.i64', 'wb') as outfile:
+            outfile.write(memoryview(self.date_offsets).cast('B'))
+        with open(tmp_dir / 'scores.i64', 'wb') as outfile:
+            outfile.write(memoryview(self.scores).cast('B'))
+        with open(tmp_dir / 'word_counts.i32', 'wb') as outfile:
+            outfile.write(memoryview(self.word_counts).cast('B'))
+        for column, (codes, values) in self.categorical_columns.items():
+            with open(tmp_dir / f'{column}.codes.i32', 'wb') as outfile:
+                outfile.write(memoryview(codes).cast('B'))
+            self._save_string_column(tmp_dir, f'{column}.values', values)
+        for column, strings in self.string_columns.items():
+            self._save_string_column(tmp_dir, column, strings)
+
+        meta = _build_meta(meta, len(self), self.dates,
+                           {column: len(values)
+                            for column, (_, values) in self.categorical_columns.items()})
+        with open(tmp_dir / 'meta.json', 'w') as outfile:
+            json.dump(meta, outfile)
+
+        shutil.rmtree(sidecar_dir, ignore_errors=True)
+        os.replace(tmp_dir, sidecar_dir)
+
+    def append_rows(self, rows, meta=None):
+        """
+        Appends comments that are not older than the last date, e.g. the comments of a new day.
+        The cost depends on the number of new comments and the number of dates, not on the
+        number of comments that are already stored.
+
+        Columns held in memory are extended. Columns loaded from a sidecar are extended on disk:
+        the new values are appended to the column files, the small date index and meta.json are
+        replaced, and the columns are mapped again. Processes that still map the old files keep
+        seeing the old comments, since load only maps as many rows as meta.json lists.
+
+        :param rows: iterable of dicts with the csv fields
+        :param meta: dict, csv information that replaces the one in meta.json, see save
+        :return: int, number of appended rows
+        """
+
+        columns = {field: [] for field in FIELDNAMES}
+        for row in rows:
+            for field in FIELDNAMES:
+                columns[field].append(row[field])
+        if not columns['date']:
+            return 0
+
+        row_dates = columns['date']
+        if any(row_dates[i] > row_dates[i + 1] for i in range(len(row_dates) - 1)):
+            order = sorted(range(len(row_dates)), key=row_dates.__getitem__)
+            columns = {field: [values[i] for i in order] for field, values in columns.items()}
+        if self.dates and columns['date'][0] < self.dates[-1]:
+            raise ValueError(f"Comments from {columns['date'][0]} can't be appended to comments "
+                             f"that end on {self.dates[-1]}.")
+
+        number_of_rows = len(self)
+        number_of_dates = len(self.dates)
+        dates = self.dates + sorted(set(columns['date']).difference(self.dates[-1:]))
+        date_code_by_date = {d: code for code, d in enumerate(dates)
+                             if code >= number_of_dates - 1}
+        date_codes = array('i', (date_code_by_date[d] for d in columns['date']))
+
+        # the old dates keep their first rows, the new dates start after the old rows
+        date_offsets = array('q', self.date_offsets[:number_of_dates])
+        i = 0
+        for code in range(number_of_dates, len(dates)):
+            while date_codes[i] < code:
+                i += 1
+            date_offsets.append(number_of_rows + i)
+        date_offsets.append(number_of_rows + len(date_codes))
+
+        scores = array('q', (int(score) for score in columns['score']))
+        word_counts = array('i', (len(text.split()) for text in columns['text']))
+
+        categorical_columns = {}
+        for column in CATEGORICAL_COLUMNS:
+            code_by_value = self._get_code_by_value(column)
+            new_values = []
+            codes = array('i')
+            for value in columns[column]:
+                code = code_by_value.get(value)
+                if code is None:
+                    code = code_by_value[value] = len(code_by_value)
+                    new_values.append(value)
+                codes.append(code)
+            categorical_columns[column] = (codes, new_values)
+
+        if self.sidecar_dir is None:
+            self.dates = dates
+            self.date_codes.extend(date_codes)
+            self.date_offsets = date_offsets
+            self.scores.extend(scores)
+            self.word_counts.extend(word_counts)
+            for column, (codes, new_values) in categorical_columns.items():
+                old_codes, values = self.categorical_columns[column]
+                old_codes.extend(codes)
+                values.extend(new_values)
+            for column in STRING_COLUMNS:
+                self.string_columns[column].extend(columns[column])
+            return len(date_codes)
+
+        sidecar_dir = self.sidecar_dir
+        _append_to_file(sidecar_dir / 'date_codes.i32', 4 * number_of_rows, date_codes)
+        _append_to_file(sidecar_dir / 'scores.i64', 8 * number_of_rows, scores)
+        _append_to_file(sidecar_dir / 'word_counts.i32', 4 * number_of_rows, word_counts)
+        categories = {}
+        for column, (codes, new_values) in categorical_columns.items():
+            _, values = self.categorical_columns[column]
+            _append_to_file(sidecar_dir / f'{column}.codes.i32', 4 * number_of_rows, codes)
+            self._append_string_column(sidecar_dir, f'{column}.values', values, new_values)
+            categories[column] = len(values) + len(new_values)
+        for column in STRING_COLUMNS:
+            self._append_string_column(sidecar_dir, column, self.string_columns[column],
+                                       columns[column])
+
+        # the date index and meta.json are replaced, so that they always match each other
+        _replace_file(sidecar_dir / 'date_offsets.i64', memoryview(date_offsets).cast('B'))
+        meta = _build_meta(dict(self.meta, **(meta or {})), number_of_rows + len(date_codes),
+                           dates, categories)
+        _replace_file(sidecar_dir / 'meta.json', json.dumps(meta).encode('utf-8'))
+
+        appended = ColumnarComments.load(sidecar_dir)
+        appended._category_codes = self._category_codes
+        vars(self).update(vars(appended))
+        return len(date_codes)
+
+    @staticmethod
+    def _save_string_column(directory, name, strings):
+        with open(directory / f'{name}.offsets.i64', 'wb') as outfile:
+            outfile.write(memoryview(strings.offsets).cast('B'))
+        with open(directory / f'{name}.blob', 'wb') as outfile:
+            outfile.write(strings.blob)
+
+    @staticmethod
+    def _append_string_column(directory, name, strings, new_strings):
+        blob_size = strings.offsets[-1]
+        appended = StringColumn.from_strings(new_strings)
+        offsets = array('q', (blob_size + offset for offset in appended.offsets[1:]))
+        _append_to_file(directory / f'{name}.offsets.i64', 8 * (len(strings) + 1), offsets)
+        _append_to_file(directory / f'{name}.blob', blob_size, appended.blob)
+
+    @classmethod
+    def load(cls, sidecar_dir):
+        """
+        Memory-maps the columns in sidecar_dir. Nothing is read until it is accessed and the
+        pages are shared between all processes that load the same sidecar.
+
+        :param sidecar_dir: Path
+        :return: ColumnarComments
+        :raises ValueError: if a column file is shorter than meta.json says
+        """
+
+        with open(sidecar_dir / 'meta.json') as infile:
+            meta = json.load(infile)
+
+        mmaps = []
+
+        def map_file(name, typecode, length):
+            """
+            Maps the first length items of a column file. Column files can be longer than
+            meta.json says if an append is in progress or crashed, even by a part of an item.
+            """
+
+            size = length * array(typecode).itemsize
+            with open(sidecar_dir / name, 'rb') as infile:
+                file_size = os.fstat(infile.fileno()).st_size
+                if file_size < size:
+                    raise ValueError(f'{sidecar_dir / name} has {file_size} bytes but '
+                                     f'meta.json needs {size}')
+                if size == 0:
+                    return array(typecode) if typecode != 'B' else b''
+                mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            mmaps.append(mapped)
+            return memoryview(mapped)[:size].cast(typecode)
+
+        def map_string_column(name, length):
+            offsets = map_file(f'{name}.offsets.i64', 'q', length + 1)
+            return StringColumn(offsets, map_file(f'{name}.blob', 'B', offsets[-1]))
+
+        number_of_rows = meta['rows']
+        date_codes = map_file('date_codes.i32', 'i', number_of_rows)
+        date_offsets = map_file('date_offsets.i64', 'q', len(meta['dates']) + 1)
+        scores = map_file('scores.i64', 'q', number_of_rows)
+        word_counts = map_file('word_counts.i32', 'i', number_of_rows)
+        categorical_columns = {}
+        for column in CATEGORICAL_COLUMNS:
+            categorical_columns[column] = (
+                map_file(f'{column}.codes.i32', 'i', number_of_rows),
+                map_string_column(f'{column}.values', meta['categories'][column]))
+        string_columns = {column: map_string_column(column, number_of_rows)
+                          for column in STRING_COLUMNS}
+
+        return cls(meta['dates'], date_codes, date_offsets, scores, word_counts,
+                   categorical_columns, string_columns, mmaps=mmaps, sidecar_dir=sidecar_dir,
+                   meta=meta)
+
+
+def _build_meta(meta, number_of_rows, dates, categories):
+    """
+    :param meta: dict, information about the csv, see load_columnar_comments
+    :param number_of_rows: int
+    :param dates: list[str]
+    :param categories: dict, categorical column -> number of distinct values
+    :return: dict, contents of meta.json. The watermark is the latest date in the sidecar
+    """
+
+    return dict(meta, version=FORMAT_VERSION, rows=number_of_rows, dates=dates,
+                categories=categories, watermark=dates[-1] if dates else None)
+
+
+def _append_to_file(path, size, values):
+    """
+    Appends values to the first size bytes of a file. Anything after them, e.g. from an append
+    that crashed before meta.json was written, is cut off.
+
+    :param path: Path
+    :param size: int
+    :param values: array or bytes
+    :return:
+    """
+
+    with open(path, 'r+b') as outfile:
+        outfile.truncate(size)
+        outfile.seek(size)
+        outfile.write(memoryview(values).cast('B'))
+
+
+def _replace_file(path, content):
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(content)
+    os.replace(tmp_path, path)
+
+
+def build_date_offsets(date_codes, number_of_dates):
+    """
+    Builds the date index of sorted date codes: the first row of every date code, followed by
+    the number of rows. Dates without comments get an empty row range.
+
+    :param date_codes: int32 array, sorted
+    :param number_of_dates: int
+    :return: int64 array with number_of_dates + 1 entries
+    """
+
+    date_offsets = array('q', [0] * (number_of_dates + 1))
+    row = 0
+    for code in range(number_of_dates):
+        date_offsets[code] = row
+        while row < len(date_codes) and date_codes[row] == code:
+            row += 1
+    date_offsets[number_of_dates] = len(date_codes)
+    return date_offsets
+
+
+def get_sidecar_dir(csv_path):
+    """
+    :param csv_path: Path, e.g. reddit_data/coronavirus.csv
+    :return: Path, e.g. reddit_data/coronavirus.csv.columns
+    """
+
+    csv_path = Path(csv_path)
+    return csv_path.with_name(f'{csv_path.name}.columns')
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def load_meta(sidecar_dir):
+    """
+    :param sidecar_dir: Path
+    :return: dict, contents of the sidecar's meta.json, or None if there is no sidecar of the
+             current FORMAT_VERSION
+    """
+
+    try:
+        with open(sidecar_dir / 'meta.json') as infile:
+            meta = json.load(infile)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get('version') != FORMAT_VERSION:
+        return None
+    return meta
+
+
+def load_fresh_columnar_comments(csv_path, verify_hash=False):
+    """
+    Memory-maps the columnar sidecar of a csv if it is up to date.
+
+    A sidecar is up to date if the csv's size and modification time did not change since it
+    was built. With verify_hash=True, a sidecar whose csv only got a new modification time
+    (e.g. after a copy or checkout) is still used if the csv's sha256 is unchanged. A sidecar
+    whose column files are missing or shorter than meta.json says is not used.
+
+    :param csv_path: Path
+    :param verify_hash: bool
+    :return: ColumnarComments or None if there is no up to date sidecar
+    """
+
+    csv_path = Path(csv_path)
+    sidecar_dir = get_sidecar_dir(csv_path)
+    csv_stat = csv_path.stat()
+
+    meta = load_meta(sidecar_dir)
+    if meta is None or meta['csv_size'] != csv_stat.st_size:
+        return None
+    if meta['csv_mtime_ns'] != csv_stat.st_mtime_ns:
+        if not verify_hash or meta['csv_sha256'] != hash_file(csv_path):
+            return None
+        meta['csv_mtime_ns'] = csv_stat.st_mtime_ns
+        with open(sidecar_dir / 'meta.json', 'w') as outfile:
+            json.dump(meta, outfile)
+
+    try:
+        return ColumnarComments.load(sidecar_dir)
+    except (OSError, ValueError) as e:
+        # e.g. a column file was truncated or deleted, the sidecar is rebuilt from the csv
+        print(f"Ignoring damaged columnar cache in {sidecar_dir}: {e}")
+        return None
+
+
+def load_columnar_comments(csv_path, verify_hash=False):
+    """
+    Loads the comments of a csv generated with reddit_scraper.py through its columnar sidecar.
+
+    The sidecar is rebuilt only if it is not up to date, see load_fresh_columnar_comments.
+    If the sidecar cannot be written, e.g. on a read-only file system, the columns are kept in
+    memory instead.
+
+    :param csv_path: Path
+    :param verify_hash: bool
+    :return: ColumnarComments
+    """
+
+    csv_path = Path(csv_path)
+    comments = load_fresh_columnar_comments(csv_path, verify_hash=verify_hash)
+    if comments is not None:
+        return comments
+
+    sidecar_dir = get_sidecar_dir(csv_path)
+    csv_stat = csv_path.stat()
+
+    print(f"Building columnar cache for {csv_path}")
+    with open(csv_path) as infile:
+        comments = ColumnarComments.from_rows(csv.DictReader(infile))
+
+    try:
+        comments.save(sidecar_dir, {'csv_size': csv_stat.st_size,
+                                    'csv_mtime_ns': csv_stat.st_mtime_ns,
+                                    'csv_sha256': hash_file(csv_path)})
+    except OSError as e:
+        print(f"Could not write columnar cache to {sidecar_dir}: {e}")
+        return comments
+
+    return ColumnarComments.load(sidecar_dir)
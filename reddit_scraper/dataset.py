@@ -1,32 +1,104 @@
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import bisect
+import copy
 import csv
-import re
+import inspect
+import itertools
+import operator
+
+from columnar import (FIELDNAMES, ColumnarComments, load_columnar_comments,
+                      load_fresh_columnar_comments, load_meta)
+from instrumentation import timer
+from query_cache import QueryCache, get_size_of_comments
+from sampling import reservoir_sample, top_k
+from term_index import TermIndex, matches_terms, tokenize
 
 import random
 # set random seed so that we can randomly select documents but will always
 # get the same selection
 random.seed(0)
 
+AGGREGATION_FREQUENCIES = {'day', 'week'}
+
 class RedditDataset:
 
-    def __init__(self, dataset_csv_file):
+    def __init__(self, dataset_csv_file, use_columnar_cache=True, persist_term_index=True,
+                 lazy=False, csv_sorted_by_date=False, stats=None, query_cache_size=128,
+                 query_cache_max_bytes=256 * 2 ** 20, verify_hash=False):
         """
         :param dataset_name: str. name of the dataset to load
+        :param use_columnar_cache: bool. load the dataset through a memory-mapped columnar
+                                   sidecar next to the csv, which is built on first use and
+                                   rebuilt whenever the csv changes. Default: True
+        :param persist_term_index: bool. store the term index (see get_term_index) in the
+                                   columnar sidecar so that it is only built once. Default: True
+        :param lazy: bool. don't load the dataset, read it on every query instead, see
+                     iter_data_sample. Uses the columnar sidecar if it is up to date, otherwise
+                     streams the csv. Nothing is built or held in memory. Default: False
+        :param csv_sorted_by_date: bool. in lazy mode, stop reading the csv at the first comment
+                                   after end_date. csvs written by reddit_scraper.py are sorted
+                                   by date. Default: False
+        :param stats: instrumentation.Stats. records the time of loading, of building the term
+                      index and of every phase of get_data_sample. Default: nothing is recorded
+        :param query_cache_size: int. number of get_data_sample results that are kept in memory
+                                 and returned again for the same query, see QueryCache.
+                                 0 disables the cache. Default: 128
+        :param query_cache_max_bytes: int. max estimated memory of the cached results.
+                                      Default: 256 MiB
+        :param verify_hash: bool. reuse the columnar sidecar if the csv only got a new
+                            modification time, e.g. after a copy or a checkout, but its sha256
+                            did not change. Reads the whole csv once to hash it. Default: False
 
         # to load a dataset, pass the name of an existing csv file generated with
         # reddit_scraper.py
         >>> c = RedditDataset('coronavirus.csv')
 
+        # to make a single pass over a dataset that does not fit into memory
+        >>> c = RedditDataset('coronavirus.csv', lazy=True, csv_sorted_by_date=True)
+        >>> for comment in c.iter_data_sample(start_date='2020-03-01', end_date='2020-03-31'):
+        ...     pass
+
         """
-        self.data = self.load_corona_data(dataset_csv_file)
-        print(f"Loaded {dataset_csv_file} dataset with {len(self.data)} comments.")
+        self.use_columnar_cache = use_columnar_cache
+        self.verify_hash = verify_hash
+        self.persist_term_index = persist_term_index
+        self.lazy = lazy
+        self.csv_sorted_by_date = csv_sorted_by_date
+        self.stats = stats
+        self.dataset_csv_file = dataset_csv_file
+        self.file_path = Path('reddit_data', dataset_csv_file)
+        self._term_index = None
+        self._aggregation_cache = {}
+        self.query_cache = QueryCache(query_cache_size, query_cache_max_bytes)
+
+        if lazy:
+            # the memory-mapped sidecar is only paged in while it is read, so it stays lazy
+            self.data = None
+            if use_columnar_cache:
+                self.data = load_fresh_columnar_comments(self.file_path, verify_hash)
+            print(f"Opened {dataset_csv_file} dataset lazily.")
+        else:
+            with timer(stats, 'dataset.load'):
+                self.data = self.load_corona_data(dataset_csv_file)
+            print(f"Loaded {dataset_csv_file} dataset with {len(self.data)} comments.")
+
+        # the part of the csv that is loaded, see refresh
+        if self.data is not None and 'csv_size' in self.data.meta:
+            self._csv_size = self.data.meta['csv_size']
+        else:
+            self._csv_size = self.file_path.stat().st_size
 
     def load_corona_data(self, dataset_csv_file):
         """
-        Loads the daily corona data from data/corona and returns it as a list of dictionaries
+        Loads the daily corona data from data/corona and returns it as a compact, column-wise
+        sequence of comments sorted by date (see columnar.ColumnarComments)
 
-        Each dictionary has the following attributes:
+        Each comment behaves like a read-only dictionary with the following attributes:
         'date': str, e.g. '2020-03-03',
         'author': str, e.g. 'SpartanMonkChaos',
         'subreddit': str, e.g. 'Coronavirus',
@@ -39,15 +111,11 @@ class RedditDataset:
 
         file_path = Path('reddit_data', dataset_csv_file)
 
-        data = []
-        with open(file_path) as infile:
-            reader = csv.DictReader(infile)
-            for row in reader:
-                row['score'] = int(row['score'])
-                data.append(row)
+        if self.use_columnar_cache:
+            return load_columnar_comments(file_path, verify_hash=self.verify_hash)
 
-        data = sorted(data, key=lambda x: x['date'])
-        return data
+        with open(file_path) as infile:
+            return ColumnarComments.from_rows(csv.DictReader(infile))
 
     def get_data_sample(
             self,
@@ -57,7 +125,8 @@ class RedditDataset:
             minimum_number_of_words_per_comment=10,
             select_by='random',
             must_include_terms: list=None,
-            must_exclude_terms: list=None
+            must_exclude_terms: list=None,
+            seed: int=None
     ):
         """
         Select a sample of the data from start to end date
@@ -69,8 +138,15 @@ class RedditDataset:
                                                          to contain to be included. default: 10
         :param select_by:           str, either "random" for random selection or "score" to select
                                          highest scoring comments. Default random.
+        :param seed:                int, seed for the random selection of this call. Default: None,
+                                         use the module's random state, which is seeded with 0.
+
+        :return: list(dict), new dicts on every call, see load_corona_data for the keys
 
-        :return: list(dicts)
+        Results are cached (see query_cache_size), so repeating a query returns new copies of
+        the same comments without searching again. The terms are compared lowercased and in
+        any order. Random selections are only cached with a seed, since without one every call
+        draws a new sample. The cache is cleared when comments are added, see append_days.
 
         # load a set with 10 random samples before 2020-01-10
         >>> dataset = RedditDataset()
@@ -95,60 +171,811 @@ class RedditDataset:
         if select_by not in {'random', 'score'}:
             raise ValueError(f'select_by has to be "random" or "score" but not {select_by}.')
 
-        comments_matching_criteria = []
-        for comment in self.data:
+        stats = self.stats
+        if stats is not None:
+            stats.increment('dataset.queries')
+
+        # lazy mode without sidecar reads the csv on every query, so nothing is cached
+        key = None
+        if self.query_cache.max_entries and self.data is not None and \
+                (select_by == 'score' or seed is not None):
+            key = (start_date, end_date, number_of_comments, minimum_number_of_words_per_comment,
+                   select_by, _normalize_terms(must_include_terms),
+                   _normalize_terms(must_exclude_terms), seed if select_by == 'random' else None)
+            cached_sample = self.query_cache.get(key)
+            if stats is not None:
+                stats.increment('dataset.query_cache_misses' if cached_sample is None
+                                else 'dataset.query_cache_hits')
+            if cached_sample is not None:
+                # every caller gets its own dicts, the cached comments are immutable
+                return [comment.to_dict() for comment in cached_sample]
+
+        if self.data is None:
+            # lazy mode without sidecar: select from the comments streamed from the csv
+            comments = self.iter_data_sample(start_date, end_date,
+                                             minimum_number_of_words_per_comment,
+                                             must_include_terms, must_exclude_terms)
+            with timer(stats, 'dataset.filter_and_select'):
+                return self._select(comments, number_of_comments, select_by, seed,
+                                    score=operator.itemgetter('score'))
+
+        with timer(stats, 'dataset.find_rows'):
+            rows = self._find_matching_rows(start_date, end_date,
+                                            minimum_number_of_words_per_comment,
+                                            must_include_terms, must_exclude_terms)
+        if stats is not None:
+            # count the matches while they are consumed, see sharded_dataset._query_shard
+            counter = itertools.count()
+            rows = map(operator.itemgetter(0), zip(rows, counter))
+
+        # rows is lazy: filtering happens while the rows are selected, in a single pass
+        with timer(stats, 'dataset.filter_and_select'):
+            sample = self._select(rows, number_of_comments, select_by, seed)
+        if stats is not None:
+            stats.increment('dataset.matches', next(counter))
+
+        # only the selected rows are turned into comments
+        with timer(stats, 'dataset.build_comments'):
+            sample = [self.data[i] for i in sample]
+        if key is not None:
+            self.query_cache.put(key, sample, get_size_of_comments(sample))
+        return [comment.to_dict() for comment in sample]
+
+    def get_data_samples(self, queries, max_workers=1):
+        """
+        Runs several get_data_sample queries together, e.g. to compare terms over the same
+        dates. The rows from the earliest start date to the latest end date are only visited
+        once for all queries, and only the selected comments are built.
+
+        Term filters use the term index like get_data_sample. Without one (lazy mode without a
+        stored term index), every comment in range is tokenized once for all queries instead of
+        once per query. With max_workers > 1, the rows are split into chunks that are matched
+        in worker processes, which map the columnar sidecar.
+
+        Every query selects the same comments as a get_data_sample call with the same
+        arguments. Queries without seed use the module's random state in the order of queries.
+        Memory grows with the number of matching rows (4 bytes each), not with the number of
+        comments in range.
+
+        # compare three terms in March
+        >>> queries = [dict(start_date='2020-03-01', end_date='2020-03-31', select_by='score',
+        ...                 must_include_terms=[term]) for term in ['trump', 'cuomo', 'mask']]
+        >>> for number_of_matches, sample in dataset.get_data_samples(queries):
+        ...     print(number_of_matches, sample[0]['text'])
+
+        :param queries: list[dict], keyword arguments of get_data_sample. Missing arguments
+                        have the defaults of get_data_sample
+        :param max_workers: int, number of worker processes. Default: 1, match in this process.
+                            Needs the columnar sidecar, without it everything runs in this process
+        :return: list[(int, list(dict))], number of matching comments and sample of every
+                 query, in the order of queries
+        """
+
+        data = self._require_columns('get_data_samples')
+        signature = inspect.signature(self.get_data_sample)
+        # a TypeError for unknown arguments, like a get_data_sample call
+        queries = [signature.bind(**query) for query in queries]
+        for query in queries:
+            query.apply_defaults()
+        queries = [dict(query.arguments) for query in queries]
+        for query in queries:
+            if query['select_by'] not in {'random', 'score'}:
+                raise ValueError(f'select_by has to be "random" or "score" but not '
+                                 f'{query["select_by"]}.')
+        if not queries:
+            return []
+
+        stats = self.stats
+        if stats is not None:
+            stats.increment('dataset.queries', len(queries))
+
+        row_ranges = [data.get_row_range(query['start_date'], query['end_date'])
+                      for query in queries]
+        first_row = min(first for first, _ in row_ranges)
+        end_row = max(end for _, end in row_ranges)
+
+        with timer(stats, 'dataset.find_rows'):
+            if max_workers > 1 and data.sidecar_dir is not None and end_row > first_row:
+                if any(query['must_include_terms'] or query['must_exclude_terms']
+                       for query in queries) and not self.lazy:
+                    # build and store the term index once, instead of in every worker
+                    self.get_term_index()
+                number_of_chunks = min(end_row - first_row, max_workers * 4)
+                chunk_size = -(-(end_row - first_row) // number_of_chunks)
+                chunk_firsts = range(first_row, end_row, chunk_size)
+                chunk_ends = [min(chunk_first + chunk_size, end_row)
+                              for chunk_first in chunk_firsts]
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    chunks = list(executor.map(
+                        _match_queries_in_worker, itertools.repeat(self.dataset_csv_file),
+                        itertools.repeat(self.persist_term_index), chunk_firsts, chunk_ends,
+                        itertools.repeat(queries)))
+            else:
+                chunks = [self._match_queries(first_row, end_row, queries)]
+        # the chunks are in row order, so the matches of every query stay in date order
+        matches = [array('i', itertools.chain.from_iterable(chunk_matches))
+                   for chunk_matches in zip(*chunks)]
+        if stats is not None:
+            stats.increment('dataset.matches', sum(map(len, matches)))
+
+        with timer(stats, 'dataset.filter_and_select'):
+            samples = [self._select(rows, query['number_of_comments'], query['select_by'],
+                                    query['seed'])
+                       for query, rows in zip(queries, matches)]
+
+        # comments that are selected by several queries are only built once
+        with timer(stats, 'dataset.build_comments'):
+            comments = {row: data[row] for row in itertools.chain.from_iterable(samples)}
+        return [(len(rows), [comments[row].to_dict() for row in sample])
+                for rows, sample in zip(matches, samples)]
+
+    def _match_queries(self, first_row, end_row, queries):
+        """
+        Finds the matching rows of every query from first_row up to end_row, see
+        get_data_samples
 
-            if comment['date'] < start_date:
+        :param first_row: int
+        :param end_row: int
+        :param queries: list[dict], complete keyword arguments of get_data_sample
+        :return: list[array], the matching rows of every query, in date order
+        """
+
+        data = self.data
+        matches = [array('i') for _ in queries]
+        row_ranges = [data.get_row_range(query['start_date'], query['end_date'])
+                      for query in queries]
+        row_ranges = [(max(first, first_row), min(end, end_row)) for first, end in row_ranges]
+
+        term_index = None
+        if any(query['must_include_terms'] or query['must_exclude_terms'] for query in queries):
+            term_index = self._term_index
+            if term_index is None and self.lazy:
+                term_index = self._load_persisted_term_index()
+            if term_index is None and not self.lazy:
+                term_index = self.get_term_index()
+
+            if term_index is None:
+                # lazy mode without term index: tokenize every comment once for all queries
+                texts = data.string_columns['text']
+                word_counts = data.word_counts
+                filters = [(first, end, query['minimum_number_of_words_per_comment'],
+                            query['must_include_terms'], query['must_exclude_terms'],
+                            query_matches)
+                           for query, (first, end), query_matches
+                           in zip(queries, row_ranges, matches)]
+                for row in range(first_row, end_row):
+                    word_count = word_counts[row]
+                    tokens = None
+                    for first, end, minimum_number_of_words, must_include_terms, \
+                            must_exclude_terms, query_matches in filters:
+                        if not first <= row < end or word_count < minimum_number_of_words:
+                            continue
+                        if must_include_terms or must_exclude_terms:
+                            if tokens is None:
+                                tokens = tokenize(texts[row])
+                            if not matches_terms(tokens, must_include_terms, must_exclude_terms):
+                                continue
+                        query_matches.append(row)
+                return matches
+
+        for query, (first, end), query_matches in zip(queries, row_ranges, matches):
+            if first >= end:
                 continue
-            if end_date < comment['date']:
-                break
-
-            if must_include_terms or must_exclude_terms:
-                text = comment['text'].lower()
-                tokenized_text = re.findall(r'\b\w\w+\b', text)
-
-                all_terms_found = True
-                if must_include_terms:
-                    must_include_terms = [term.lower() for term in must_include_terms]
-                    for term in must_include_terms:
-                        if term not in tokenized_text:
-                            all_terms_found = False
-                            break
-
-                excluded_terms_found = False
-                if must_exclude_terms:
-                    must_exclude_terms = [term.lower() for term in must_exclude_terms]
-
-                    for term in must_exclude_terms:
-                        if term in tokenized_text:
-                            excluded_terms_found = True
-                            break
+            if query['must_include_terms'] or query['must_exclude_terms']:
+                rows = term_index.match(first, end, query['must_include_terms'],
+                                        query['must_exclude_terms'])
+            else:
+                rows = range(first, end)
+            query_matches.extend(data.filter_by_word_count(
+                rows, query['minimum_number_of_words_per_comment']))
+        return matches
 
+    def iter_data_sample(
+            self,
+            start_date='2020-01-01',
+            end_date='2020-04-04',
+            minimum_number_of_words_per_comment=10,
+            must_include_terms: list=None,
+            must_exclude_terms: list=None
+    ):
+        """
+        Yields every comment from start to end date that matches the same criteria as
+        get_data_sample, in date order, one at a time.
+
+        In lazy mode without an up to date columnar sidecar, the csv is streamed row by row, so
+        memory use does not depend on the size of the dataset. With csv_sorted_by_date, reading
+        stops at the first comment after end_date.
+
+        :param start_date:          str, default: '2020-01-01'
+        :param end_date:            str, default: '2020-04-04'
+        :param minimum_number_of_words_per_comment: int, default: 10
+        :param must_include_terms:  list[str]
+        :param must_exclude_terms:  list[str]
+        :return: generator of dict
+
+        # export all comments that mention masks in March
+        >>> dataset = RedditDataset('coronavirus.csv', lazy=True, csv_sorted_by_date=True)
+        >>> mask_comments = dataset.iter_data_sample('2020-03-01', '2020-03-31',
+        ...                                          must_include_terms=['mask'])
+        """
+
+        if self.data is not None:
+            for row in self._find_matching_rows(start_date, end_date,
+                                                minimum_number_of_words_per_comment,
+                                                must_include_terms, must_exclude_terms):
+                yield self.data[row].to_dict()
+            return
+
+        filter_terms = must_include_terms or must_exclude_terms
+        with open(self.file_path) as infile:
+            for row in csv.DictReader(infile):
+
+                date = row['date']
+                if date < start_date:
+                    continue
+                if end_date < date:
+                    if self.csv_sorted_by_date:
+                        break
+                    continue
+
+                text = row['text']
+                if len(text.split()) < minimum_number_of_words_per_comment:
+                    continue
+                if filter_terms and not matches_terms(tokenize(text), must_include_terms,
+                                                      must_exclude_terms):
+                    continue
+
+                yield {'date': date, 'author': row['author'], 'subreddit': row['subreddit'],
+                       'score': int(row['score']), 'url': row['url'], 'text': text}
+
+    def _find_matching_rows(self, start_date, end_date, minimum_number_of_words_per_comment,
+                            must_include_terms=None, must_exclude_terms=None,
+                            excluded_rows=None):
+        """
+        Lazily finds the rows of all comments that match the criteria of get_data_sample
+
+        :param start_date:  str
+        :param end_date:    str
+        :param minimum_number_of_words_per_comment: int
+        :param must_include_terms: list[str]
+        :param must_exclude_terms: list[str]
+        :param excluded_rows: set[int], rows to skip, e.g. duplicates of another dataset
+        :return: iterable of int, in date order
+        """
+
+        data = self.data
+        first_row, end_row = data.get_row_range(start_date, end_date)
+        if must_include_terms or must_exclude_terms:
+            term_index = self._term_index
+            if term_index is None and self.lazy:
+                term_index = self._load_persisted_term_index()
+            if term_index is None and self.lazy:
+                # lazy mode does not build a term index, tokenize the comments in range instead
+                texts = data.string_columns['text']
+                rows = (row for row in range(first_row, end_row)
+                        if matches_terms(tokenize(texts[row]), must_include_terms,
+                                         must_exclude_terms))
             else:
-                all_terms_found = True
-                excluded_terms_found = False
+                rows = self.get_term_index().match(first_row, end_row,
+                                                   must_include_terms, must_exclude_terms)
+        else:
+            rows = range(first_row, end_row)
+
+        if excluded_rows:
+            rows = itertools.filterfalse(excluded_rows.__contains__, rows)
 
+        return data.filter_by_word_count(rows, minimum_number_of_words_per_comment)
 
-            if (
-                len(comment['text'].split()) >= minimum_number_of_words_per_comment and
-                all_terms_found and
-                excluded_terms_found is False
-            ):
-                comments_matching_criteria.append(comment)
+    def _select(self, items, number_of_comments, select_by, seed=None, score=None):
+        """
+        Selects number_of_comments items in a single pass with O(number_of_comments) memory
+
+        :param items: iterable of rows or of comments
+        :param number_of_comments: int
+        :param select_by: str, either "random" or "score"
+        :param seed: int, seed for the random selection. None: module random state
+        :param score: function that returns the score of an item. Default: score of a row
+        :return: list
+        """
 
         if select_by == 'random':
-            if len(comments_matching_criteria) <= number_of_comments:
-                sample = comments_matching_criteria
+            rng = random if seed is None else random.Random(seed)
+            return reservoir_sample(items, number_of_comments, rng=rng)
+        if score is None:
+            score = self.data.scores.__getitem__
+        return top_k(items, number_of_comments, key=score)
+
+    def get_term_index(self):
+        """
+        Returns the inverted index that answers must_include_terms and must_exclude_terms.
+
+        The index is built the first time a query uses terms, which tokenizes every comment
+        once. With persist_term_index, it is stored in the columnar sidecar and memory-mapped
+        by later runs.
+
+        :return: TermIndex
+        """
+
+        if self._term_index is None:
+            self._term_index = self._load_term_index()
+        return self._term_index
+
+    def _ingest_rows(self, rows):
+        """
+        Appends rows that were just added to the end of the csv to the columns and updates the
+        term index and cached aggregations
+
+        :param rows: list of dicts with the csv fields, not older than the watermark
+        :return: int, number of added comments
+        """
+
+        if not rows:
+            return 0
+
+        number_of_comments = len(self.data)
+        csv_stat = self.file_path.stat()
+        # the sha256 of the whole csv would cost as much as a rebuild, so verify_hash can't
+        # reuse the sidecar after an append
+        self.data.append_rows(rows, {'csv_size': csv_stat.st_size,
+                                     'csv_mtime_ns': csv_stat.st_mtime_ns,
+                                     'csv_sha256': None})
+        self._csv_size = csv_stat.st_size
+        self.query_cache.clear()
+
+        self._update_term_index(number_of_comments)
+        self._update_cached_aggregations(min(row['date'] for row in rows))
+        print(f"Added {len(rows)} comments up to {self.get_watermark()}.")
+        return len(rows)
+
+    def _update_term_index(self, number_of_indexed_comments):
+        """
+        Adds the new comments to the term index, if it is loaded or stored in the sidecar.
+        Otherwise, it is built when a query needs it.
+
+        :param number_of_indexed_comments: int, number of comments before the append
+        :return:
+        """
+
+        term_index = self._term_index
+        index_dir = self._get_term_index_dir()
+        if term_index is None and index_dir is not None and index_dir.exists():
+            term_index = TermIndex.load(index_dir)
+        if term_index is None or term_index.number_of_rows != number_of_indexed_comments:
+            self._term_index = None
+            return
+
+        # only the new comments are tokenized
+        term_index.extend(self.data.string_columns['text'])
+        if index_dir is not None:
+            term_index.save(index_dir)
+        self._term_index = term_index
+
+    def _get_term_index_dir(self):
+        if self.persist_term_index and self.data.sidecar_dir is not None:
+            return self.data.sidecar_dir / 'term_index'
+        return None
+
+    def _load_persisted_term_index(self):
+        """
+        :return: TermIndex or None if no up to date term index is stored in the sidecar
+        """
+
+        index_dir = self._get_term_index_dir()
+        if index_dir is not None and index_dir.exists():
+            term_index = TermIndex.load(index_dir)
+            if term_index.number_of_rows == len(self.data):
+                return term_index
+        return None
+
+    def _load_term_index(self):
+        self._require_columns('The term index')
+
+        term_index = self._load_persisted_term_index()
+        if term_index is not None:
+            return term_index
+
+        print("Building term index")
+        with timer(self.stats, 'dataset.build_term_index'):
+            term_index = TermIndex.build(self.data.string_columns['text'])
+        index_dir = self._get_term_index_dir()
+        if index_dir is not None:
+            try:
+                term_index.save(index_dir)
+            except OSError as e:
+                print(f"Could not store term index in {index_dir}: {e}")
+        return term_index
+
+    def get_watermark(self):
+        """
+        Returns the latest date of the dataset. Comments up to this date have been ingested,
+        see append_days. Stored in the columnar sidecar's meta.json.
+
+        :return: str, e.g. '2020-04-04', or None if the dataset is empty
+        """
+
+        data = self._require_columns('The watermark')
+        return data.dates[-1] if data.dates else None
+
+    def append_days(self, day_csv_files):
+        """
+        Adds the comments of new scrapes, e.g. the csv of yesterday written by a daily job, to
+        the dataset without loading it again.
+
+        Only comments after the watermark (see get_watermark) are added, so a day that was
+        already ingested is skipped. The comments are appended to the dataset's csv and its
+        columnar sidecar; the date index, the term index and cached aggregations are updated
+        in place. The cost depends on the number of new comments, not on the size of the
+        dataset.
+
+        # ingest yesterday's scrape
+        >>> dataset = RedditDataset('coronavirus.csv')
+        >>> dataset.append_days(['coronavirus_2020-04-05.csv'])
+
+        :param day_csv_files: list[str], names of csv files in the data folder that were
+                              generated with reddit_scraper.py
+        :return: int, number of added comments
+        """
+
+        watermark = self.get_watermark()
+        rows = []
+        for day_csv_file in day_csv_files:
+            with open(Path('reddit_data', day_csv_file)) as infile:
+                rows += (row for row in csv.DictReader(infile)
+                         if watermark is None or row['date'] > watermark)
+        if not rows:
+            return 0
+        rows.sort(key=operator.itemgetter('date'))
+
+        with open(self.file_path, 'a') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, extrasaction='ignore')
+            writer.writerows(rows)
+        return self._ingest_rows(rows)
+
+    def refresh(self):
+        """
+        Adds the comments that were appended to the dataset's csv since it was loaded, e.g. by
+        append_days in another process or by a scraper that continued the csv. Comments that
+        another process already added to the columnar sidecar are mapped from there. Otherwise
+        only the new end of the csv is read, and the indexes are updated like in append_days.
+        If the csv was rewritten instead, or the new comments are older than the watermark, the
+        whole dataset is loaded again.
+
+        :return: int, number of added comments
+        """
+
+        data = self._require_columns('Refreshing')
+        csv_size = self.file_path.stat().st_size
+        if csv_size == self._csv_size:
+            return 0
+
+        if csv_size > self._csv_size:
+            number_of_mapped_comments = self._map_appended_comments(csv_size)
+            if self._csv_size == csv_size:
+                return number_of_mapped_comments
+
+            with open(self.file_path) as infile:
+                infile.seek(self._csv_size)
+                rows = list(csv.DictReader(infile, fieldnames=FIELDNAMES))
+            watermark = self.get_watermark()
+            if watermark is None or all(row['date'] >= watermark for row in rows):
+                return number_of_mapped_comments + self._ingest_rows(rows)
+
+        print(f"{self.file_path} was rewritten, loading it again.")
+        number_of_comments = len(data)
+        self.data = self.load_corona_data(self.dataset_csv_file)
+        self._csv_size = self.data.meta.get('csv_size', self.file_path.stat().st_size)
+        self._term_index = None
+        self._aggregation_cache = {}
+        self.query_cache.clear()
+        return len(self.data) - number_of_comments
+
+    def _map_appended_comments(self, csv_size):
+        """
+        Maps the comments that another process, e.g. with append_days, appended to the csv and
+        to the columnar sidecar since this dataset was loaded. Appending them again would
+        duplicate them and rewrite column files that the other process has mapped.
+
+        :param csv_size: int, current size of the csv
+        :return: int, number of mapped comments
+        """
+
+        sidecar_dir = self.data.sidecar_dir
+        meta = None if sidecar_dir is None else load_meta(sidecar_dir)
+        if meta is None or meta.get('csv_size') is None or \
+                not self._csv_size < meta['csv_size'] <= csv_size or \
+                meta['rows'] < len(self.data):
+            return 0
+
+        number_of_comments = len(self.data)
+        self.data = ColumnarComments.load(sidecar_dir)
+        # the other process stored its update of the term index, which is loaded when needed
+        self._term_index = None
+        self._csv_size = self.data.meta['csv_size']
+        self.query_cache.clear()
+        if len(self.data) > number_of_comments:
+            self._update_cached_aggregations(self.data.get_date(number_of_comments))
+        print(f"Mapped {len(self.data) - number_of_comments} comments added by another process.")
+        return len(self.data) - number_of_comments
+
+    def count_comments_per_day(self, start_date='2020-01-01', end_date='2020-04-04'):
+        """
+        Counts the comments of every day from start to end date. Only days with comments are
+        included. Uses the date index, so the cost does not depend on the number of comments.
+
+        :param start_date:          str, default: '2020-01-01'
+        :param end_date:            str, default: '2020-04-04'
+        :return: dict, date -> number of comments
+
+        >>> counts = dataset.count_comments_per_day(start_date='2020-03-01', end_date='2020-03-02')
+        >>> list(counts)
+        ['2020-03-01', '2020-03-02']
+        """
+
+        return self._require_columns('Counting').count_by_date(start_date, end_date)
+
+    def count_comments(self, start_date='2020-01-01', end_date='2020-04-04', frequency='day',
+                       subreddit=None):
+        """
+        Counts the comments per day or week.
+
+        All aggregations group the comments with the date index: every day is a contiguous
+        block of rows, so a day's aggregate is computed over array slices without visiting the
+        comments one by one in Python. Results are cached per set of arguments.
+        Only days (or weeks) with comments are included; weeks are labelled with their monday.
+
+        :param start_date:  str, default: '2020-01-01'
+        :param end_date:    str, default: '2020-04-04'
+        :param frequency:   str, either "day" or "week". Default: day
+        :param subreddit:   str, only count comments from this subreddit, e.g. 'Coronavirus'.
+                                 Default: all subreddits
+        :return: dict, date -> number of comments
+
+        # number of comments per week in March
+        >>> weekly_counts = dataset.count_comments('2020-03-01', '2020-03-31', frequency='week')
+        """
+
+        def aggregate(first_date):
+            subreddit_codes, subreddit_code = self._get_subreddit_filter(subreddit)
+
+            def count_rows(first_row, end_row):
+                if subreddit_codes is None:
+                    return end_row - first_row
+                return sum(map(subreddit_code.__eq__, subreddit_codes[first_row:end_row]))
+
+            return self._aggregate_by_period(first_date, end_date, frequency, count_rows)
+
+        return self._get_cached_aggregation(
+            ('count_comments', start_date, end_date, frequency, subreddit),
+            start_date, end_date, frequency, aggregate)
+
+    def sum_scores(self, start_date='2020-01-01', end_date='2020-04-04', frequency='day',
+                   subreddit=None):
+        """
+        Sums the scores of all comments per day or week, see count_comments
+
+        :param start_date:  str, default: '2020-01-01'
+        :param end_date:    str, default: '2020-04-04'
+        :param frequency:   str, either "day" or "week". Default: day
+        :param subreddit:   str, only include comments from this subreddit. Default: all
+        :return: dict, date -> sum of scores
+        """
+
+        def aggregate(first_date):
+            scores = self._require_columns('Aggregating').scores
+            subreddit_codes, subreddit_code = self._get_subreddit_filter(subreddit)
+
+            def sum_rows(first_row, end_row):
+                if subreddit_codes is None:
+                    return sum(scores[first_row:end_row])
+                return sum(itertools.compress(
+                    scores[first_row:end_row],
+                    map(subreddit_code.__eq__, subreddit_codes[first_row:end_row])))
+
+            return self._aggregate_by_period(first_date, end_date, frequency, sum_rows)
+
+        return self._get_cached_aggregation(
+            ('sum_scores', start_date, end_date, frequency, subreddit),
+            start_date, end_date, frequency, aggregate)
+
+    def mean_scores(self, start_date='2020-01-01', end_date='2020-04-04', frequency='day',
+                    subreddit=None):
+        """
+        Averages the scores of all comments per day or week, see count_comments
+
+        :param start_date:  str, default: '2020-01-01'
+        :param end_date:    str, default: '2020-04-04'
+        :param frequency:   str, either "day" or "week". Default: day
+        :param subreddit:   str, only include comments from this subreddit. Default: all
+        :return: dict, date -> mean score
+        """
+
+        counts = self.count_comments(start_date, end_date, frequency, subreddit)
+        sums = self.sum_scores(start_date, end_date, frequency, subreddit)
+        return {period: sums[period] / count for period, count in counts.items() if count}
+
+    def count_comments_by_subreddit(self, start_date='2020-01-01', end_date='2020-04-04',
+                                    frequency='day'):
+        """
+        Counts the comments of every subreddit per day or week, see count_comments
+
+        :param start_date:  str, default: '2020-01-01'
+        :param end_date:    str, default: '2020-04-04'
+        :param frequency:   str, either "day" or "week". Default: day
+        :return: dict, date -> dict, subreddit -> number of comments
+        """
+
+        def aggregate(first_date):
+            data = self._require_columns('Aggregating')
+            subreddit_codes, subreddit_names = data.categorical_columns['subreddit']
+
+            def count_rows(first_row, end_row):
+                return Counter(subreddit_codes[first_row:end_row])
+
+            counts = self._aggregate_by_period(first_date, end_date, frequency, count_rows)
+            return {period: {subreddit_names[code]: count for code, count in counter.items()}
+                    for period, counter in counts.items()}
+
+        return self._get_cached_aggregation(
+            ('count_comments_by_subreddit', start_date, end_date, frequency),
+            start_date, end_date, frequency, aggregate)
+
+    def count_term_mentions(self, terms, start_date='2020-01-01', end_date='2020-04-04',
+                            frequency='day'):
+        """
+        Counts the comments that mention each term per day or week, see count_comments.
+        Terms are matched like must_include_terms in get_data_sample.
+
+        :param terms:       list[str], e.g. ['trump', 'cuomo']
+        :param start_date:  str, default: '2020-01-01'
+        :param end_date:    str, default: '2020-04-04'
+        :param frequency:   str, either "day" or "week". Default: day
+        :return: dict, term -> dict, date -> number of comments mentioning the term
+
+        >>> mentions = dataset.count_term_mentions(['trump', 'cuomo'], frequency='week')
+        """
+
+        mentions = {}
+        for term in terms:
+
+            def aggregate(first_date, term=term):
+                rows = self.get_term_index().get_rows(term)
+
+                def count_rows(first_row, end_row):
+                    return bisect.bisect_left(rows, end_row) - bisect.bisect_left(rows, first_row)
+
+                return self._aggregate_by_period(first_date, end_date, frequency, count_rows)
+
+            mentions[term] = self._get_cached_aggregation(
+                ('count_term_mentions', term.lower(), start_date, end_date, frequency),
+                start_date, end_date, frequency, aggregate)
+        return mentions
+
+    def _get_subreddit_filter(self, subreddit):
+        """
+        :param subreddit: str or None
+        :return: (subreddit codes of all rows, code of subreddit) or (None, None) without filter
+        """
+
+        if subreddit is None:
+            return None, None
+        data = self._require_columns('Aggregating')
+        subreddit_codes, _ = data.categorical_columns['subreddit']
+        subreddit_code = data.get_category_code('subreddit', subreddit)
+        # -1 matches no comment
+        return subreddit_codes, -1 if subreddit_code is None else subreddit_code
+
+    def _aggregate_by_period(self, start_date, end_date, frequency, aggregate_rows):
+        """
+        Aggregates every day with aggregate_rows(first_row, end_row) and adds up the days of
+        every period.
+
+        :param start_date:      str
+        :param end_date:        str
+        :param frequency:       str, either "day" or "week"
+        :param aggregate_rows:  function(first_row, end_row) -> int, Counter or anything else
+                                that supports +
+        :return: dict, period -> aggregate
+        """
+
+        if frequency not in AGGREGATION_FREQUENCIES:
+            raise ValueError(f'frequency has to be "day" or "week" but not {frequency}.')
+
+        data = self._require_columns('Aggregating')
+        first_code, end_code = data.get_date_code_range(start_date, end_date)
+        aggregates = {}
+        for code in range(first_code, end_code):
+            period = data.dates[code]
+            if frequency == 'week':
+                day = datetime.strptime(period, '%Y-%m-%d').date()
+                period = (day - timedelta(days=day.weekday())).isoformat()
+
+            aggregate = aggregate_rows(data.date_offsets[code], data.date_offsets[code + 1])
+            if period in aggregates:
+                aggregates[period] = aggregates[period] + aggregate
             else:
-                sample = random.sample(comments_matching_criteria, number_of_comments)
-        else:
-            sample = sorted(comments_matching_criteria,
-                            key=lambda x: x['score'], reverse=True)[:number_of_comments]
+                aggregates[period] = aggregate
+        return aggregates
+
+    def _get_cached_aggregation(self, key, start_date, end_date, frequency, aggregate):
+        """
+        Returns a copy of the cached result for key, computing it on the first call
+
+        :param key: tuple, the name of the aggregation and all of its arguments
+        :param start_date: str
+        :param end_date: str
+        :param frequency: str, either "day" or "week"
+        :param aggregate: function(first_date) -> dict, the aggregates of all periods from
+                          first_date up to end_date. Called again by append_days and refresh
+                          for the periods that got new comments
+        :return: copy of the result
+        """
+
+        if key not in self._aggregation_cache:
+            self._aggregation_cache[key] = (aggregate(start_date), start_date, end_date,
+                                            frequency, aggregate)
+        return copy.deepcopy(self._aggregation_cache[key][0])
+
+    def _update_cached_aggregations(self, first_new_date):
+        """
+        Recomputes the periods of all cached aggregations from the period of first_new_date on.
+        Earlier periods did not change.
+
+        :param first_new_date: str, the earliest date with new comments
+        :return:
+        """
+
+        for result, start_date, end_date, frequency, aggregate in \
+                self._aggregation_cache.values():
+            if end_date < first_new_date:
+                continue
+            first_date = first_new_date
+            if frequency == 'week':
+                day = datetime.strptime(first_new_date, '%Y-%m-%d').date()
+                first_date = (day - timedelta(days=day.weekday())).isoformat()
+            result.update(aggregate(max(start_date, first_date)))
+
+    def _require_columns(self, feature):
+        """
+        :param feature: str, what needs the columns, for the error message
+        :return: ColumnarComments
+        """
+
+        if self.data is None:
+            raise ValueError(f"{feature} needs the columnar sidecar, which is not available in "
+                             f"lazy mode.")
+        return self.data
+
+
+def _normalize_terms(terms):
+    """
+    :param terms: list[str] or None
+    :return: tuple[str], lowercased, sorted and without duplicates, so that term lists that
+             match the same comments give the same cache key
+    """
+
+    return tuple(sorted({term.lower() for term in terms or ()}))
+
+
+# datasets opened by a worker process of get_data_samples, so that every process only maps
+# each sidecar once
+_worker_datasets = {}
 
-        return sample
 
+def _match_queries_in_worker(dataset_csv_file, persist_term_index, first_row, end_row, queries):
+    """
+    Matches the queries against a chunk of rows in a worker process, see get_data_samples
 
+    :return: list[array], the matching rows of every query
+    """
 
+    if dataset_csv_file not in _worker_datasets:
+        # lazy only maps the sidecar and the stored term index, it never builds them
+        _worker_datasets[dataset_csv_file] = RedditDataset(
+            dataset_csv_file, persist_term_index=persist_term_index, lazy=True,
+            query_cache_size=0)
+    dataset = _worker_datasets[dataset_csv_file]
+    dataset._require_columns('get_data_samples')
+    return dataset._match_queries(first_row, end_row, queries)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,168 @@
+import gzip
+import http.client
+import threading
+import urllib.error
+import urllib.parse
+import zlib
+
+# a GET is sent again to the Location of these responses, see HttpSession.get
+REDIRECT_STATUS_CODES = {301, 302, 303, 307, 308}
+
+
+class HttpSession:
+
+    def __init__(self, timeout=30, max_idle_connections=8, user_agent='covid-vis reddit scraper',
+                 max_redirects=5):
+        """
+        Minimal keep-alive HTTP client that reuses connections across requests.
+
+        Opening a new urllib connection for every request pays a full TCP and TLS handshake
+        each time. The session instead keeps up to max_idle_connections open connections per
+        host and hands them out to whichever thread sends the next request. Responses are
+        requested gzip-compressed and decompressed transparently.
+
+        Like urllib, redirects are followed, every other status outside of 2xx raises
+        urllib.error.HTTPError and network problems raise ConnectionError or socket.timeout.
+        Unlike urllib, proxies (e.g. from the HTTP_PROXY environment variables) are not used.
+
+        :param timeout: float, seconds to wait for connecting and for each read
+        :param max_idle_connections: int, max number of idle connections kept open per host
+        :param user_agent: str
+        :param max_redirects: int, max number of redirects followed for one request
+        """
+
+        self.timeout = timeout
+        self.max_idle_connections = max_idle_connections
+        self.max_redirects = max_redirects
+        self.headers = {
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'User-Agent': user_agent,
+        }
+
+        self._idle_connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Sends a GET request and returns the decompressed response body
+
+        :param url: str
+        :return: bytes
+        """
+
+        for _ in range(self.max_redirects + 1):
+            response, body = self._send(url)
+            location = response.getheader('Location')
+            if response.status not in REDIRECT_STATUS_CODES or location is None:
+                break
+            url = urllib.parse.urljoin(url, location)
+        else:
+            raise urllib.error.HTTPError(url, response.status,
+                                         f'More than {self.max_redirects} redirects',
+                                         response.headers, None)
+
+        if not 200 <= response.status < 300:
+            raise urllib.error.HTTPError(url, response.status, response.reason,
+                                         response.headers, None)
+
+        encoding = response.getheader('Content-Encoding', '').lower()
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        return body
+
+    def _send(self, url):
+        """
+        Sends a single GET request over a pooled connection
+
+        :param url: str
+        :return: (HTTPResponse, bytes: the raw response body)
+        """
+
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += f'?{parts.query}'
+
+        connection, reused = self._acquire_connection(host)
+        try:
+            response = self._request(connection, path)
+        except (ConnectionError, http.client.BadStatusLine):
+            connection.close()
+            if not reused:
+                raise
+            # the server closed an idle keep-alive connection, retry once on a fresh one
+            connection, _ = self._acquire_connection(host, fresh=True)
+            try:
+                response = self._request(connection, path)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+
+        try:
+            body = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release_connection(host, connection)
+        return response, body
+
+    def close(self):
+        """
+        Closes all idle connections
+
+        :return:
+        """
+
+        with self._lock:
+            idle_connections = self._idle_connections
+            self._idle_connections = {}
+        for connections in idle_connections.values():
+            for connection in connections:
+                connection.close()
+
+    def _request(self, connection, path):
+        connection.request('GET', path, headers=self.headers)
+        return connection.getresponse()
+
+    def _acquire_connection(self, host, fresh=False):
+        """
+        Returns an idle connection to host or opens a new one
+
+        :param host: (scheme, netloc)
+        :param fresh: bool, always open a new connection
+        :return: (HTTPConnection, bool: whether the connection was reused)
+        """
+
+        if not fresh:
+            with self._lock:
+                connections = self._idle_connections.get(host)
+                if connections:
+                    return connections.pop(), True
+
+        scheme, netloc = host
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        elif scheme == 'http':
+            connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        else:
+            raise ValueError(f"Unsupported url scheme {scheme}.")
+        return connection, False
+
+    def _release_connection(self, host, connection):
+        with self._lock:
+            connections = self._idle_connections.setdefault(host, [])
+            if len(connections) < self.max_idle_connections:
+                connections.append(connection)
+                return
+        connection.close()
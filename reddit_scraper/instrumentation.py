@@ -0,0 +1,189 @@
+import contextlib
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+class Stats:
+
+    def __init__(self, callback=None):
+        """
+        Counters and timers for the hot paths of RedditScraper, RedditDataset and the twitter
+        scraper, e.g. request latency, bytes received, rate limit waits, parsed rows and the
+        phases of get_data_sample.
+
+        All of them take an optional stats parameter. Without it, nothing is measured, so
+        instrumentation costs nothing unless it is turned on. Measurements are taken per
+        request, per day or per query, not per comment. Safe to share between threads.
+
+        # find out where the time of a scrape goes
+        >>> stats = Stats()
+        >>> r = RedditScraper(subreddit='coronavirus', stats=stats)
+        >>> r.execute_query_and_store_as_csv()
+        >>> print(stats.report())
+
+        :param callback: function(name, value), called for every measurement with the amount
+                         that is added to a counter or the seconds that are added to a timer,
+                         e.g. to forward measurements to a metrics system or to log slow requests
+        """
+
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.timer_counts = defaultdict(int)
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        """
+        :param name: str, e.g. 'scraper.bytes_received'
+        :param value: int
+        :return:
+        """
+
+        with self._lock:
+            self.counters[name] += value
+        if self.callback is not None:
+            self.callback(name, value)
+
+    def add_time(self, name, seconds):
+        """
+        :param name: str, e.g. 'scraper.request'
+        :param seconds: float
+        :return:
+        """
+
+        with self._lock:
+            self.timers[name] += seconds
+            self.timer_counts[name] += 1
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Adds the time spent in the with block to a timer
+
+        >>> with stats.timer('dataset.build_comments'):
+        ...     comments = [data[row] for row in rows]
+
+        :param name: str
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def rate(self, counter, timer):
+        """
+        Returns a counter per second of a timer, e.g. rows parsed per second
+
+        :param counter: str, e.g. 'scraper.rows_written'
+        :param timer: str, e.g. 'scraper.csv_write'
+        :return: float, 0 if the timer is empty
+        """
+
+        with self._lock:
+            seconds = self.timers.get(timer, 0)
+            return self.counters.get(counter, 0) / seconds if seconds else 0.0
+
+    def snapshot(self):
+        """
+        :return: dict with the 'counters' and 'timers'. Every timer is a dict with its total
+                 'seconds' and the 'count' of measurements
+        """
+
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {name: {'seconds': seconds, 'count': self.timer_counts[name]}
+                           for name, seconds in self.timers.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.timer_counts.clear()
+
+    def report(self):
+        """
+        :return: str, all counters and timers sorted by name, one per line
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+        for name, measured in sorted(snapshot['timers'].items()):
+            lines.append(f"{name:40s} {measured['seconds']:10.3f} s  {measured['count']:8d} x  "
+                         f"{measured['seconds'] / measured['count'] * 1000:10.3f} ms avg")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"{name:40s} {value:10d}")
+        return '\n'.join(lines)
+
+
+# reusable, since it does nothing
+_NO_TIMER = contextlib.nullcontext()
+
+
+def timer(stats, name):
+    """
+    Times a with block like Stats.timer, or does nothing if stats is None
+
+    :param stats: Stats or None
+    :param name: str
+    :return: context manager
+    """
+
+    if stats is None:
+        return _NO_TIMER
+    return stats.timer(name)
+
+
+@contextlib.contextmanager
+def capture_profile(output_path=None, trace_memory=False, limit=25):
+    """
+    Profiles everything in the with block with cProfile and, with trace_memory, records memory
+    allocations with tracemalloc. Both slow the code down a lot, so this is meant for a single
+    scrape or query, not for production runs.
+
+    When the block ends, the functions with the highest cumulative time are printed and, with
+    trace_memory, the peak memory and the lines that allocated the most memory still in use.
+
+    # profile a slow query
+    >>> with capture_profile('query.prof', trace_memory=True):
+    ...     dataset.get_data_sample(must_include_terms=['mask'])
+
+    :param output_path: str or Path, write the raw cProfile stats to this file, e.g. to load
+                        them with pstats or snakeviz. Default: only print them
+    :param trace_memory: bool, also record memory allocations
+    :param limit: int, number of functions and allocation sites that are printed
+    :return: cProfile.Profile
+    """
+
+    if trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+
+        if output_path is not None:
+            profiler.dump_stats(str(output_path))
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        print(output.getvalue())
+
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"peak memory: {peak / 2 ** 20:.1f} MiB")
+            for statistic in snapshot.statistics('lineno')[:limit]:
+                print(statistic)
@@ -0,0 +1,121 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+
+    def __init__(self, max_entries=128, max_size_bytes=256 * 2 ** 20):
+        """
+        In-memory least recently used cache for query results, e.g. the samples of
+        RedditDataset.get_data_sample.
+
+        Results are stored as tuples, so they can't be changed through the cache. Every entry
+        has an estimated size (see get_size_of_comments); once the cache holds more than
+        max_entries entries or max_size_bytes bytes, the least recently used entries are evicted.
+        A result that is larger than max_size_bytes on its own is not cached.
+
+        >>> cache = QueryCache(max_entries=2)
+        >>> cache.put('a', [1, 2], size_bytes=100)
+        >>> cache.get('a')
+        (1, 2)
+        >>> cache.get('b') is None
+        True
+        >>> cache.hits, cache.misses
+        (1, 1)
+
+        :param max_entries: int, max number of cached results. 0 disables the cache
+        :param max_size_bytes: int, max estimated size of all cached results. None: unlimited
+        """
+
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+
+        # key -> (result, size_bytes), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :param key: hashable, e.g. a normalized query
+        :return: tuple, the cached result, or None if key is not cached
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, size_bytes):
+        """
+        :param key: hashable
+        :param result: iterable, stored as a tuple
+        :param size_bytes: int, estimated memory used by result
+        :return:
+        """
+
+        if not self.max_entries or \
+                (self.max_size_bytes is not None and size_bytes > self.max_size_bytes):
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (tuple(result), size_bytes)
+            self.size_bytes += size_bytes
+
+            while len(self._entries) > self.max_entries or \
+                    (self.max_size_bytes is not None and self.size_bytes > self.max_size_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries, e.g. because the data they were computed from changed. The
+        statistics are kept.
+
+        :return:
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def get_stats(self):
+        """
+        :return: dict with the number of 'hits', 'misses' and 'evictions', the number of
+                 cached 'entries' and their estimated 'size_bytes'
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'size_bytes': self.size_bytes}
+
+
+def get_size_of_comments(comments):
+    """
+    Estimates the memory used by a list of comments, including their strings. Strings that
+    are shared between comments, e.g. dates, are counted for every comment, so the estimate
+    errs on the high side.
+
+    :param comments: list of Comment
+    :return: int, bytes
+    """
+
+    getsizeof = sys.getsizeof
+    return getsizeof(comments) + sum(
+        getsizeof(comment) + getsizeof(comment.date) + getsizeof(comment.author) +
+        getsizeof(comment.subreddit) + getsizeof(comment.url) + getsizeof(comment.text)
+        for comment in comments)
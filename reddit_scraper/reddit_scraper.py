@@ -1,28 +1,162 @@
+import bisect
 import csv
 import html
+import http.client
 import json
+import os
+import random
+import socket
+import threading
 import time
-import urllib.request
+import urllib.error
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from datetime import datetime, timezone
+from datetime import datetime
 from pathlib import Path
 
+try:
+    # orjson decodes large responses several times faster than the json module
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+from http_session import HttpSession
+from instrumentation import Stats, timer
+from response_cache import ResponseCache
+
+CSV_FIELDNAMES = ['date', 'author', 'subreddit', 'score', 'url', 'text']
+
+# http status codes after which a request is worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# hot days are split into windows of this many seconds, which are downloaded in parallel
+HOT_DAY_WINDOW_SECONDS = 60 * 60
+
+
+class RateLimiter:
+
+    def __init__(self, requests_per_second=1.0, burst=1):
+        """
+        Token bucket that limits how many requests are sent to pushshift.io.
+        Up to burst requests can go out back to back, after that requests are spaced out so that
+        on average no more than requests_per_second are sent. Safe to share between threads.
+
+        :param requests_per_second: float, average number of requests per second
+        :param burst: int, number of requests that can be sent without waiting
+        """
+        if requests_per_second <= 0 or burst < 1:
+            raise ValueError("requests_per_second and burst have to be positive.")
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request can be sent.
+
+        :return: float, seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._last_refill) * self.requests_per_second)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.requests_per_second
+            time.sleep(wait)
+            waited += wait
+
+
+class LocalDateConverter:
+
+    def __init__(self):
+        """
+        Converts utc timestamps to local dates, e.g. 1585742400 -> '2020-04-01'.
+
+        Converting every timestamp through datetime and strftime is slow and almost always
+        produces the same few dates, since a day window only spans one or two local days. The
+        converter therefore remembers the local midnight boundaries of every day it has seen
+        and answers timestamps inside known boundaries with a bisect instead.
+        """
+
+        self._boundaries = []
+        self._dates = []
+
+    def convert(self, timestamps):
+        """
+        :param timestamps: list of int or float, utc timestamps
+        :return: list[str], local dates as 'YYYY-MM-DD'
+        """
+
+        return [self(timestamp) for timestamp in timestamps]
+
+    def __call__(self, timestamp):
+        i = bisect.bisect_right(self._boundaries, timestamp)
+        # odd positions lie between a day's start and end boundary
+        if i % 2:
+            return self._dates[i // 2]
+
+        local_date = datetime.fromtimestamp(timestamp).date()
+        date_str = local_date.isoformat()
+        next_date = local_date + timedelta(days=1)
+        start = datetime(local_date.year, local_date.month, local_date.day).timestamp()
+        end = datetime(next_date.year, next_date.month, next_date.day).timestamp()
+
+        # only cache if midnight is well defined, which is not the case on some dst changes
+        if start <= timestamp < end:
+            position = bisect.bisect_right(self._boundaries, start)
+            if position % 2 == 0 and (position == len(self._boundaries) or
+                                      end <= self._boundaries[position]):
+                self._boundaries[position:position] = [start, end]
+                self._dates.insert(position // 2, date_str)
+
+        return date_str
+
 
 class RedditScraper:
 
     def __init__(self,
                search_term=None, subreddit=None, number_of_results_per_day=1000,
                start_date='2020-01-01', end_date='2030-01-01',
-               min_score=0, sort_by='score', filename=None
+               min_score=0, sort_by='score', filename=None,
+               max_concurrent_requests=1, requests_per_second=1.0,
+               max_retries=5, retry_backoff=1.0, page_size=100,
+               response_cache: ResponseCache=None, http_session: HttpSession=None,
+               base_url='https://api.pushshift.io', stats: Stats=None
                ):
         """
 
         :param search_term: all comments need to include this search term
         :param subreddit: limit results to subreddit
-        :param number_of_results: max number of comments to return
+        :param number_of_results_per_day: max number of comments to return per day. If this is
+                                          larger than page_size and sort_by is 'created_utc',
+                                          days are paginated.
         :param start_date: all comments need to be posted on or after this date (format: YYYY-MM-DD)
         :param end_date: all comments need to be posted before or on this date (format: YYYY-MM-DD)
         :param min_score: minimum score (upvotes) for a comment to be included.
+        :param sort_by: str, e.g. 'score' to keep the highest scoring comments of every day or
+                        'created_utc' to keep the most recent ones. Only 'created_utc' can be
+                        paginated, with any other order a day returns at most page_size comments.
+        :param max_concurrent_requests: number of days that are downloaded in parallel
+        :param requests_per_second: average number of requests per second sent to pushshift.io
+        :param max_retries: number of times a failed request is retried before giving up
+        :param retry_backoff: seconds to wait before the first retry, doubled on every retry
+        :param page_size: max number of comments pushshift.io returns per request
+        :param response_cache: ResponseCache, on-disk cache for raw responses. Default: no cache
+        :param http_session: HttpSession, keep-alive connection pool shared by all requests.
+                             Default: a new session with a 30 second timeout
+        :param base_url: str, pushshift.io or a local stand-in server, e.g. 'http://localhost:8000'
+        :param stats: Stats, records request latency, bytes received, rate limit waits, parse and
+                      csv write times (see instrumentation.py). Default: nothing is recorded
         """
 
         # the code in the init file mostly just validates the input, e.g. are the submitted dates
@@ -50,9 +184,35 @@ class RedditScraper:
         for param in [number_of_results_per_day, min_score]:
             if not isinstance(param, int) or param < 0:
                 raise ValueError("number_of_results and min_score have to be positive integers.")
+        if not isinstance(page_size, int) or page_size < 1:
+            raise ValueError("page_size has to be a positive integer.")
+        self.page_size = page_size
         self.number_of_results = number_of_results_per_day
         self.min_score = min_score
         self.sort_by = sort_by
+        if number_of_results_per_day > page_size and sort_by != 'created_utc':
+            print(f"pushshift.io returns at most {page_size} comments per request, so only "
+                  f"the top {page_size} comments by {sort_by} are downloaded per day. Pass "
+                  f"sort_by='created_utc' to paginate days up to {number_of_results_per_day} "
+                  f"comments, newest first.")
+
+        if not isinstance(max_concurrent_requests, int) or max_concurrent_requests < 1:
+            raise ValueError("max_concurrent_requests has to be a positive integer.")
+        self.max_concurrent_requests = max_concurrent_requests
+        self._request_slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self.rate_limiter = RateLimiter(requests_per_second=requests_per_second,
+                                        burst=max_concurrent_requests)
+
+        if not isinstance(max_retries, int) or max_retries < 0:
+            raise ValueError("max_retries has to be a positive integer.")
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.response_cache = response_cache
+        if http_session is None:
+            http_session = HttpSession()
+        self.http_session = http_session
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
 
         if not filename:
             filename = self._generate_filename()
@@ -78,31 +238,247 @@ class RedditScraper:
 
         return f'{name_parts}.csv'
 
-    def execute_query_and_store_as_csv(self, output_filename=None):
+    def execute_query_and_store_as_csv(self, output_filename=None, resume=False):
         """
-        Execute search and stores result as a csv file
+        Execute search and stores result as a csv file.
+        Every day is appended to the csv as soon as it is downloaded, so memory use does not grow
+        with the length of the date range and a crash keeps everything written up to that point.
+
+        Completed days are recorded in a checkpoint file next to the csv. With resume=True, days
+        that are already in the checkpoint are skipped and only the missing days are appended.
+
+        # rerun a query that crashed halfway through
+        >>> r = RedditScraper(subreddit='coronavirus', filename='coronavirus.csv')
+        >>> r.execute_query_and_store_as_csv(resume=True)
 
+        :param output_filename: str
+        :param resume: bool, continue from the checkpoint of a previous run of the same query
         :return:
         """
 
-        documents = []
+        if not output_filename:
+            output_filename = self.filename
+
+        checkpoint = None
+        if resume:
+            checkpoint = self._load_checkpoint(output_filename)
+        if checkpoint is None:
+            checkpoint = {'query': self._generate_query_signature(),
+                          'completed_days': [],
+                          'csv_offset': None}
+        elif checkpoint['query'] != self._generate_query_signature():
+            raise ValueError(f"The checkpoint for {output_filename} was created by a different "
+                             f"query and cannot be resumed.")
+        else:
+            print(f"resuming {output_filename}, skipping {len(checkpoint['completed_days'])} "
+                  f"completed days")
+
+        completed_days = set(checkpoint['completed_days'])
+        missing_days = (day for day in self._generate_days()
+                        if day.isoformat() not in completed_days)
+        documents_by_day = ((day, self._convert_documents(raw_documents)) for day, raw_documents
+                            in self._fetch_days_in_order(missing_days))
+        number_of_documents = self._store_documents_to_csv(documents_by_day, output_filename,
+                                                           checkpoint=checkpoint)
+
+        print(f'Found {number_of_documents} matching your search query.')
+
+    def _generate_days(self):
+        """
+        Yields all days from the start date up to and including the end date
 
+        :return: generator of date
+        """
         current_date = self.start_date_date
-
-        # iterate over all days from the start date (= current_date) as long as current_date
-        # is less than the end date
         while current_date <= self.end_date_date:
-
-            print(f"downloading comments from {current_date}")
-            url = self._generate_query_url(start_date=current_date,
-                                           end_date=current_date + timedelta(days=1))
-            documents += self._get_documents(url)
+            yield current_date
             current_date += timedelta(days=1)
-            time.sleep(1)
 
-        self._store_documents_to_csv(documents, output_filename)
+    def _fetch_day(self, day, window_executor=None):
+        """
+        Downloads the raw documents of one day. Worker threads only download and decode, the
+        conversion to csv rows is left to the caller.
+
+        If number_of_results_per_day fits into a single page or sort_by is not 'created_utc',
+        this is one request sorted by sort_by. Otherwise the day is paginated newest first with
+        a created_utc cursor until it is exhausted or number_of_results_per_day is reached.
+        If the first page is full, the rest of the day is split into hour windows that are
+        downloaded in parallel on window_executor, newest first. No more windows are started
+        once the limit is reached.
+
+        :param day: date
+        :param window_executor: ThreadPoolExecutor for the hour windows of hot days
+        :return: list[dict]
+        """
+        print(f"downloading comments from {day}")
+        if self.number_of_results <= self.page_size or self.sort_by != 'created_utc':
+            url = self._generate_query_url(start_date=day, end_date=day + timedelta(days=1))
+            return self._download_documents(url)
+
+        after, before = self._get_timestamp_window(day, day + timedelta(days=1))
+        documents = self._download_documents(
+            self._generate_window_url(after, before, self.page_size, sort_by='created_utc'))
+        if len(documents) < self.page_size or window_executor is None:
+            return self._paginate_window(after, before, self.number_of_results,
+                                         first_page=documents)
+
+        # hot day: split everything older than the first page into hour windows.
+        # after and before are exclusive, so every window starts one second before the end of
+        # the next older window and the first one ends one second after the oldest document on
+        # the first page. comments posted in these seconds are fetched twice and deduplicated
+        oldest_timestamp = min(doc['created_utc'] for doc in documents)
+        window_ends = iter(range(oldest_timestamp + 1, after, -HOT_DAY_WINDOW_SECONDS))
+        seen = {self._get_document_key(doc) for doc in documents}
+        pending = deque()
+
+        def submit_next_window():
+            end = next(window_ends, None)
+            if end is not None:
+                window_after = max(after, end - HOT_DAY_WINDOW_SECONDS - 1)
+                # the window also returns the comments of the overlapping seconds that are
+                # already downloaded, which are removed as duplicates
+                number_of_overlapping = sum(1 for doc in documents
+                                            if window_after < doc['created_utc'] < end)
+                pending.append(window_executor.submit(
+                    self._paginate_window, window_after, end,
+                    self.number_of_results - len(documents) + number_of_overlapping))
+
+        # only max_concurrent_requests windows run ahead, so that a day stops sending
+        # requests soon after its limit is reached
+        for _ in range(self.max_concurrent_requests):
+            submit_next_window()
+        while pending and len(documents) < self.number_of_results:
+            for doc in pending.popleft().result():
+                if len(documents) >= self.number_of_results:
+                    break
+                key = self._get_document_key(doc)
+                if key not in seen:
+                    seen.add(key)
+                    documents.append(doc)
+            submit_next_window()
+        for future in pending:
+            future.cancel()
+        return documents
+
+    def _paginate_window(self, after, before, limit, first_page=None):
+        """
+        Downloads up to limit documents posted between the after and before timestamps, newest
+        first. Every page moves the before cursor to the oldest document of the previous page.
+
+        :param after: int, timestamp
+        :param before: int, timestamp
+        :param limit: int, max number of documents
+        :param first_page: list[dict], already downloaded first page of this window
+        :return: list[dict]
+        """
+        documents = []
+        seen = set()
+        page = first_page
+        while len(documents) < limit:
+            if page is None:
+                # always a full page: the page starts with the already seen comments of the
+                # boundary second, a smaller page could hold nothing else
+                page = self._download_documents(
+                    self._generate_window_url(after, before, self.page_size,
+                                              sort_by='created_utc'))
+
+            new_documents = [doc for doc in page if self._get_document_key(doc) not in seen]
+            # no progress means more than a page of comments share one second, give up on those
+            if not new_documents:
+                break
+            documents += new_documents[:limit - len(documents)]
+            seen.update(self._get_document_key(doc) for doc in new_documents)
+
+            if len(page) < self.page_size:
+                break
+            before = min(doc['created_utc'] for doc in page) + 1
+            page = None
+
+        return documents
+
+    @staticmethod
+    def _get_document_key(doc):
+        return doc.get('id') or doc.get('permalink') or (doc['created_utc'], doc['author'])
 
-        print(f'Found {len(documents)} matching your search query.')
+    def _download_with_retries(self, url):
+        """
+        Downloads a url, retrying network errors, timeouts, rate limit and server errors with
+        exponential backoff. Every attempt waits for the rate limiter.
+        Responses are served from and stored in the response cache if there is one.
+
+        :param url: str
+        :return: bytes
+        """
+        stats = self.stats
+        if self.response_cache is not None:
+            response = self.response_cache.get(url)
+            if stats is not None:
+                stats.increment('scraper.cache_hits' if response is not None
+                                else 'scraper.cache_misses')
+            if response is not None:
+                return response
+            if self.response_cache.offline:
+                raise LookupError(f"{url} is not in the response cache and the cache is offline.")
+
+        for attempt in range(self.max_retries + 1):
+            waited = self.rate_limiter.acquire()
+            try:
+                # day and hour window threads share the slots, see _fetch_days_in_order
+                with self._request_slots:
+                    start = time.perf_counter()
+                    response = self._download(url)
+                if stats is not None:
+                    stats.add_time('scraper.rate_limit_wait', waited)
+                    stats.add_time('scraper.request', time.perf_counter() - start)
+                    # after decompression, see HttpSession
+                    stats.increment('scraper.bytes_received', len(response))
+                if self.response_cache is not None:
+                    self.response_cache.put(url, response)
+                return response
+            except urllib.error.HTTPError as e:
+                if e.code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                error = e
+            except (urllib.error.URLError, http.client.HTTPException, ConnectionError,
+                    socket.timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                error = e
+
+            wait = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            print(f"request failed ({error}), retrying in {wait:.1f} seconds")
+            if stats is not None:
+                stats.add_time('scraper.rate_limit_wait', waited)
+                stats.increment('scraper.retries')
+                stats.add_time('scraper.retry_backoff', wait)
+            time.sleep(wait)
+
+    def _fetch_days_in_order(self, days):
+        """
+        Downloads the documents of all days with up to max_concurrent_requests requests in flight.
+        Days and the hour windows of hot days run in separate thread pools, but every request
+        waits for one of max_concurrent_requests slots, so together they never exceed the cap.
+        Results are yielded in the order of days, no matter in which order the requests finish.
+        At most twice max_concurrent_requests days are fetched ahead of the day that is yielded
+        next so that fast days don't pile up in memory behind a slow one.
+
+        :param days: iterable of date
+        :return: generator of (date, list[dict])
+        """
+        max_pending = 2 * self.max_concurrent_requests
+        # hour windows of hot days get their own pool so that a day waiting for its windows
+        # can never block the windows from running
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor, \
+                ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as window_executor:
+            pending = deque()
+            for day in days:
+                pending.append((day, executor.submit(self._fetch_day, day, window_executor)))
+                if len(pending) >= max_pending:
+                    next_day, future = pending.popleft()
+                    yield next_day, future.result()
+            while pending:
+                next_day, future = pending.popleft()
+                yield next_day, future.result()
 
     def _generate_query_url(self, start_date=None, end_date=None):
         """
@@ -118,92 +494,249 @@ class RedditScraper:
         'https://api.pushshift.io/reddit/search/?size=100&after=1388552400&before=1420002000&sort_type=score&sort=desc'
         """
 
-        search_params = {}
-        if self.search_term:
-            search_params['q'] = self.search_term
-        if self.subreddit:
-            search_params['subreddit'] = self.subreddit
-        search_params['size'] = self.number_of_results
-
         if not start_date:
             start_date = self.start_date_date
         if not end_date:
             end_date = self.end_date_date
 
-        start_timestamp = int(datetime(start_date.year, start_date.month,
-                                       start_date.day).timestamp())
-        end_timestamp = int(datetime(end_date.year, end_date.month, end_date.day).timestamp())
+        start_timestamp, end_timestamp = self._get_timestamp_window(start_date, end_date)
+
+        return self._generate_window_url(start_timestamp, end_timestamp, self.number_of_results,
+                                         sort_by=self.sort_by)
 
-        search_params['after'] = start_timestamp
-        search_params['before'] = end_timestamp
+    def _generate_window_url(self, after, before, size, sort_by=None):
+        """
+        Generates a url to query pushshift.io for comments posted between two timestamps
 
-        if self.sort_by:
-            search_params['sort_type'] = self.sort_by
+        :param after: int, timestamp
+        :param before: int, timestamp
+        :param size: int, number of results
+        :param sort_by: str, e.g. 'score' or 'created_utc'. sorted descending.
+        :return: str
+        """
+
+        search_params = {}
+        if self.search_term:
+            search_params['q'] = self.search_term
+        if self.subreddit:
+            search_params['subreddit'] = self.subreddit
+        search_params['size'] = size
+
+        search_params['after'] = after
+        search_params['before'] = before
+
+        if sort_by:
+            search_params['sort_type'] = sort_by
             search_params['sort'] = 'desc'
 
-        url = f'https://api.pushshift.io/reddit/search/?{urllib.parse.urlencode(search_params)}'
+        url = f'{self.base_url}/reddit/search/?{urllib.parse.urlencode(search_params)}'
 
         if self.min_score and self.min_score > 0:
             url += f'&score=>{self.min_score}'
 
         return url
 
+    @staticmethod
+    def _get_timestamp_window(start_date, end_date):
+        """
+        Converts a start and end date to the local midnight timestamps used by pushshift.io
+
+        :param start_date: date
+        :param end_date: date
+        :return: (int, int)
+        """
+
+        start_timestamp = int(datetime(start_date.year, start_date.month,
+                                       start_date.day).timestamp())
+        end_timestamp = int(datetime(end_date.year, end_date.month, end_date.day).timestamp())
+        return start_timestamp, end_timestamp
+
     def _get_documents(self, url):
         """
         Downloads up to number_of_documents matching the search query from pushshift.io
 
+        :param url: str
+        :return: generator of dict
+        """
+
+        return self._parse_documents(self._download_with_retries(url))
+
+    def _download_documents(self, url):
+        """
+        Downloads a query url and returns the raw, decoded documents
+
         :param url: str
         :return: list[dict]
         """
 
-        documents = []
-        with urllib.request.urlopen(url) as response:
-            response = response.read().decode('utf-8')
+        response = self._download_with_retries(url)
+        with timer(self.stats, 'scraper.json_decode'):
+            return _json_loads(response)['data']
 
-            for doc_raw in json.loads(response)['data']:
+    def _download(self, url):
+        """
+        Downloads the raw response for a query url over the shared keep-alive session
 
-                timestamp = doc_raw['created_utc']
-                datetime_utc = datetime.utcfromtimestamp(timestamp)
-                datetime_est = datetime_utc.replace(tzinfo=timezone.utc).astimezone(tz=None)
-                date_str = datetime_est.strftime('%Y-%m-%d')
+        :param url: str
+        :return: bytes
+        """
 
-                if 'permalink' in doc_raw:
-                    url = f'https://www.reddit.com{doc_raw["permalink"]}'
-                else:
-                    url = 'n/a'
+        return self.http_session.get(url)
+
+    def _parse_documents(self, response):
+        """
+        Parses a raw pushshift.io response and yields one csv row per comment
 
-                documents.append({
-                    'date': date_str,
-                    'author': doc_raw['author'],
-                    'subreddit': doc_raw['subreddit'],
-                    'score': doc_raw['score'],
-                    'url': url,
-                    'text': html.unescape(doc_raw['body']),
-                })
+        :param response: bytes
+        :return: generator of dict
+        """
 
-        print(len(documents))
+        with timer(self.stats, 'scraper.json_decode'):
+            raw_documents = _json_loads(response)['data']
+        return self._convert_documents(raw_documents)
 
-        return documents
+    def _convert_documents(self, raw_documents):
+        """
+        Converts raw pushshift.io documents to csv rows.
+        The dates of all documents are converted in one batch, see LocalDateConverter.
+
+        :param raw_documents: list[dict]
+        :return: generator of dict
+        """
+
+        with timer(self.stats, 'scraper.date_conversion'):
+            dates = LocalDateConverter().convert([doc_raw['created_utc']
+                                                  for doc_raw in raw_documents])
+        if self.stats is not None:
+            self.stats.increment('scraper.documents_parsed', len(raw_documents))
+        unescape = html.unescape
+
+        for date_str, doc_raw in zip(dates, raw_documents):
+
+            if 'permalink' in doc_raw:
+                url = f'https://www.reddit.com{doc_raw["permalink"]}'
+            else:
+                url = 'n/a'
 
-    def _store_documents_to_csv(self, documents, filename):
+            text = doc_raw['body']
+            if '&' in text:
+                text = unescape(text)
+
+            yield {
+                'date': date_str,
+                'author': doc_raw['author'],
+                'subreddit': doc_raw['subreddit'],
+                'score': doc_raw['score'],
+                'url': url,
+                'text': text,
+            }
+
+        print(len(dates))
+
+    def _store_documents_to_csv(self, documents_by_day, filename, checkpoint=None):
         """
         Stores the downloaded documents in a csv in the data folder.
         If no filename is provided, it will automatically generate one.
+        Rows are written as they arrive and the file is flushed after every day.
+
+        If a checkpoint is passed, every completed day and the size of the csv after it are
+        recorded in the checkpoint file. A checkpoint that already contains days continues the
+        existing csv: anything written after the last completed day is cut off and the new days
+        are appended.
 
-        :param documents: list[dict]
+        :param documents_by_day: iterable of (date, iterable of dicts), one tuple per day
         :param filename: str
-        :return:
+        :param checkpoint: dict, as created in execute_query_and_store_as_csv
+        :return: int, number of stored documents
         """
 
         if not filename:
             filename = self.filename
+        file_path = Path('reddit_data', filename)
+
+        resume = checkpoint is not None and checkpoint['csv_offset'] is not None
+        number_of_documents = 0
+        with open(file_path, 'r+' if resume else 'w') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+            if resume:
+                csvfile.seek(checkpoint['csv_offset'])
+                csvfile.truncate()
+            else:
+                writer.writeheader()
+
+            for day, documents in documents_by_day:
+                if self.stats is None:
+                    for doc in documents:
+                        writer.writerow(doc)
+                        number_of_documents += 1
+                    csvfile.flush()
+                else:
+                    # converting and writing are timed separately, which needs the converted
+                    # rows of the day in memory
+                    with self.stats.timer('scraper.convert'):
+                        documents = list(documents)
+                    with self.stats.timer('scraper.csv_write'):
+                        writer.writerows(documents)
+                        csvfile.flush()
+                    number_of_documents += len(documents)
+                    self.stats.increment('scraper.rows_written', len(documents))
+
+                if checkpoint is not None:
+                    checkpoint['completed_days'].append(day.isoformat())
+                    checkpoint['csv_offset'] = csvfile.tell()
+                    self._save_checkpoint(filename, checkpoint)
+
+        return number_of_documents
+
+    def _generate_query_signature(self):
+        """
+        Describes the query independent of its date range. A checkpoint can only be resumed by a
+        scraper with the same signature.
+
+        :return: dict
+        """
+
+        return {
+            'search_term': self.search_term,
+            'subreddit': self.subreddit,
+            'number_of_results_per_day': self.number_of_results,
+            'min_score': self.min_score,
+            'sort_by': self.sort_by,
+        }
+
+    @staticmethod
+    def _get_checkpoint_path(filename):
+        return Path('reddit_data', f'{filename}.checkpoint.json')
+
+    def _load_checkpoint(self, filename):
+        """
+        Loads the checkpoint of a csv. Returns None if there is no checkpoint or no csv to resume.
+
+        :param filename: str
+        :return: dict or None
+        """
+
+        checkpoint_path = self._get_checkpoint_path(filename)
+        if not checkpoint_path.exists() or not Path('reddit_data', filename).exists():
+            return None
+        with open(checkpoint_path) as infile:
+            return json.load(infile)
+
+    def _save_checkpoint(self, filename, checkpoint):
+        """
+        Writes the checkpoint to a temporary file first and then replaces the old one so that a
+        crash while writing never leaves a corrupt checkpoint behind.
+
+        :param filename: str
+        :param checkpoint: dict
+        :return:
+        """
 
-        with open(Path('reddit_data', filename), 'w') as csvfile:
-            fieldnames = ['date', 'author', 'subreddit', 'score', 'url', 'text']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for doc in documents:
-                writer.writerow(doc)
+        checkpoint_path = self._get_checkpoint_path(filename)
+        tmp_path = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+        with open(tmp_path, 'w') as outfile:
+            json.dump(checkpoint, outfile)
+        os.replace(tmp_path, checkpoint_path)
 
 
 if __name__ == '__main__':
@@ -211,6 +744,7 @@ if __name__ == '__main__':
                       number_of_results_per_day=2000, min_score=2,
                       start_date='2020-01-28',
                       end_date='2020-01-30',
-                      filename='coronavirus.csv')
+                      filename='coronavirus.csv',
+                      max_concurrent_requests=4, requests_per_second=2)
     r.execute_query_and_store_as_csv()
 
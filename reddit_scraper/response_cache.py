@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+
+class ResponseCache:
+
+    def __init__(self, cache_dir='reddit_cache', ttl=None, max_size_bytes=None, offline=False):
+        """
+        On-disk cache for raw pushshift.io responses.
+
+        Every response is stored gzip-compressed in a file named after the sha256 of its
+        normalized url, so the same query always maps to the same file no matter in which order
+        its parameters were added. Entries older than ttl seconds are ignored. If the cache grows
+        beyond max_size_bytes, the least recently used entries are deleted.
+
+        With offline=True nothing is downloaded: every url has to be in the cache. This lets
+        notebooks and benchmarks replay a previous scrape without network access.
+
+        # replay a scrape from the cache without touching the network
+        >>> cache = ResponseCache('reddit_cache', offline=True)
+        >>> r = RedditScraper(subreddit='coronavirus', response_cache=cache)
+
+        :param cache_dir: str or Path, directory that holds the cached responses
+        :param ttl: int, seconds after which a cached response is stale. None: never stale
+        :param max_size_bytes: int, max size of all cached files. None: unlimited
+        :param offline: bool, raise a LookupError instead of downloading on a cache miss
+        """
+
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_size_bytes = max_size_bytes
+        self.offline = offline
+
+        self._size_bytes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_url(url):
+        """
+        Normalizes a url so that equivalent queries share a cache entry: scheme and host are
+        lowercased and query parameters are sorted.
+
+        >>> ResponseCache.normalize_url('https://API.pushshift.io/reddit/search/?size=100&q=mask')
+        'https://api.pushshift.io/reddit/search/?q=mask&size=100'
+
+        :param url: str
+        :return: str
+        """
+
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query,
+                                                                      keep_blank_values=True)))
+        return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path,
+                                        query, ''))
+
+    def _get_path(self, url):
+        key = hashlib.sha256(self.normalize_url(url).encode('utf-8')).hexdigest()
+        return self.cache_dir / key[:2] / f'{key}.gz'
+
+    def get(self, url):
+        """
+        Returns the cached response for a url or None if it is not cached or stale.
+
+        :param url: str
+        :return: bytes or None
+        """
+
+        path = self._get_path(url)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        now = time.time()
+        if self.ttl is not None and now - stat.st_mtime > self.ttl:
+            return None
+
+        try:
+            with open(path, 'rb') as infile:
+                response = gzip.decompress(infile.read())
+        except (FileNotFoundError, EOFError, OSError):
+            # evicted by another thread or a truncated file
+            return None
+
+        # the access time is the lru clock, the modification time is the ttl clock
+        os.utime(path, (now, stat.st_mtime))
+        return response
+
+    def put(self, url, response):
+        """
+        Stores the response for a url and evicts old entries if the cache is too large.
+
+        :param url: str
+        :param response: bytes
+        :return:
+        """
+
+        path = self._get_path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = gzip.compress(response)
+
+        tmp_path = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as outfile:
+            outfile.write(compressed)
+        # an existing entry, e.g. a stale one that was downloaded again, is replaced
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+
+        if self.max_size_bytes is not None:
+            with self._lock:
+                if self._size_bytes is None:
+                    self._size_bytes = sum(size for _, _, size in self._scan())
+                else:
+                    self._size_bytes += len(compressed) - replaced_size
+                if self._size_bytes > self.max_size_bytes:
+                    self._evict()
+
+    def responses(self):
+        """
+        Yields every cached response, e.g. to use a recorded scrape as benchmark fixtures.
+        Sorted by file name so that the order is the same on every run.
+
+        :return: generator of bytes
+        """
+
+        for path in sorted(self.cache_dir.glob('*/*.gz')):
+            with open(path, 'rb') as infile:
+                yield gzip.decompress(infile.read())
+
+    def _scan(self):
+        """
+        :return: list of (last access time, path, size in bytes) for all cached files
+        """
+
+        entries = []
+        for path in self.cache_dir.glob('*/*.gz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        """
+        Deletes the least recently used entries until the cache uses at most 90% of
+        max_size_bytes. Needs to be called with the lock held.
+
+        :return:
+        """
+
+        entries = sorted(self._scan())
+        self._size_bytes = sum(size for _, _, size in entries)
+        target = 0.9 * self.max_size_bytes
+        for _, path, size in entries:
+            if self._size_bytes <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._size_bytes -= size
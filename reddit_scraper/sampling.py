@@ -0,0 +1,64 @@
+import heapq
+import itertools
+import math
+import random
+
+
+def top_k(iterable, k, key):
+    """
+    Returns the k items with the highest key, highest first, keeping a heap of at most k items.
+    Items with the same key keep their order, so this matches sorted(..., reverse=True)[:k].
+    Runs in O(n log k) time and O(k) memory.
+
+    :param iterable: iterable
+    :param k: int
+    :param key: function
+    :return: list
+    """
+
+    return heapq.nlargest(k, iterable, key=key)
+
+
+def reservoir_sample(iterable, k, rng=random):
+    """
+    Selects k items uniformly at random in a single pass without materializing the iterable.
+    If the iterable has at most k items, all of them are returned in their original order.
+
+    Uses Algorithm L (Li, 1994), which draws the number of items to skip before the next
+    replacement instead of a random number per item. Runs in O(k (1 + log(n / k))) random draws
+    and O(k) memory.
+
+    :param iterable: iterable
+    :param k: int
+    :param rng: random.Random or the random module, which is seeded at import in dataset.py
+    :return: list
+    """
+
+    iterator = iter(iterable)
+    reservoir = list(itertools.islice(iterator, k))
+    if len(reservoir) < k or k == 0:
+        return reservoir
+
+    w = math.exp(math.log(_random_open(rng)) / k)
+    while True:
+        skip = int(math.log(_random_open(rng)) / math.log1p(-w)) if w < 1 else 0
+        item = next(itertools.islice(iterator, skip, None), _END)
+        if item is _END:
+            return reservoir
+        reservoir[rng.randrange(k)] = item
+        w *= math.exp(math.log(_random_open(rng)) / k)
+
+
+# marks the end of the iterator in reservoir_sample
+_END = object()
+
+
+def _random_open(rng):
+    """
+    :return: float, uniformly distributed in the open interval (0, 1)
+    """
+
+    while True:
+        u = rng.random()
+        if u > 0:
+            return u
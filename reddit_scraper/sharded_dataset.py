@@ -0,0 +1,360 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import bisect
+import heapq
+import itertools
+import operator
+import os
+import random
+
+from columnar import load_columnar_comments
+from dataset import RedditDataset
+from sampling import top_k
+
+
+class ShardedRedditDataset:
+
+    def __init__(self, dataset_csv_files, max_workers=None):
+        """
+        Several csv files generated with reddit_scraper.py, e.g. one per subreddit or search
+        term, queried as one dataset.
+
+        Every csv is a shard with its own columnar sidecar (see RedditDataset). Sidecars are
+        built in a process pool, so loading many new csvs uses all cores. Comments that were
+        scraped into more than one csv are deduplicated on their url: the shards are merged by
+        date with a k-way merge and every url is only kept in the first shard that has it.
+        Queries run on all shards in parallel and their results are merged. If a csv changes,
+        e.g. because days were appended to it, all shards are opened again and the duplicates
+        are found again before the next query.
+
+        # load all csvs that start with coronavirus_
+        >>> dataset = ShardedRedditDataset('coronavirus_*.csv')
+        >>> sample = dataset.get_data_sample(must_include_terms=['cuomo'], select_by='score')
+
+        :param dataset_csv_files: str, glob pattern for the csv files in the data folder, or
+                                  list[str], names of the csv files
+        :param max_workers: int, number of worker processes. Default: number of cpus.
+                            With 1, everything runs in this process.
+        """
+
+        if isinstance(dataset_csv_files, str):
+            dataset_csv_files = sorted(path.name for path
+                                       in Path('reddit_data').glob(dataset_csv_files))
+        if not dataset_csv_files:
+            raise ValueError("No csv files to load.")
+        self.dataset_csv_files = list(dataset_csv_files)
+
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._load()
+
+    def _load(self):
+        """
+        Opens all shards at their current version and finds their duplicates. The worker
+        processes that run queries are started again, so they get the new excluded rows.
+
+        :return:
+        """
+
+        self.close()
+        if self.max_workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        try:
+            # build missing or stale sidecars in parallel, the shards below only map them
+            list(self._map(_build_sidecar, self.dataset_csv_files))
+            self._csv_versions = [_get_csv_version(dataset_csv_file)
+                                  for dataset_csv_file in self.dataset_csv_files]
+            self.shards = [_get_dataset(dataset_csv_file, csv_version) for dataset_csv_file,
+                           csv_version in zip(self.dataset_csv_files, self._csv_versions)]
+
+            self._excluded_rows = self._find_duplicates()
+        finally:
+            self.close()
+
+        if self.max_workers > 1:
+            # the workers that run queries get the excluded rows once, not with every query
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_set_excluded_rows,
+                initargs=(dict(zip(self.dataset_csv_files, self._excluded_rows)),))
+        number_of_duplicates = sum(len(rows) for rows in self._excluded_rows)
+        print(f"Loaded {len(self.shards)} shards with {len(self)} comments "
+              f"({number_of_duplicates} duplicates removed).")
+
+    def _load_if_changed(self):
+        """
+        Opens all shards again if any csv changed since they were loaded. The row numbers of
+        the excluded rows only hold for the version of a shard they were found in.
+
+        :return:
+        """
+
+        if any(_get_csv_version(dataset_csv_file) != csv_version for dataset_csv_file,
+               csv_version in zip(self.dataset_csv_files, self._csv_versions)):
+            print("Shards changed since they were loaded, loading them again.")
+            self._load()
+
+    def __len__(self):
+        return sum(len(shard.data) for shard in self.shards) - \
+            sum(len(rows) for rows in self._excluded_rows)
+
+    def close(self):
+        """
+        Shuts down the worker processes
+
+        :return:
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_data_sample(
+            self,
+            start_date='2020-01-01',
+            end_date='2020-04-04',
+            number_of_comments=1000000,
+            minimum_number_of_words_per_comment=10,
+            select_by='random',
+            must_include_terms: list=None,
+            must_exclude_terms: list=None,
+            seed: int=None
+    ):
+        """
+        Select a sample of the data from start to end date, see RedditDataset.get_data_sample.
+
+        Every shard selects up to number_of_comments comments in its own process. For
+        select_by="score", the highest scoring comments of all shards are kept. For
+        select_by="random", the number of comments taken from each shard is drawn in
+        proportion to its number of matches, so every matching comment is equally likely to be
+        selected, no matter which shard it is in.
+
+        :return: list(dict), see RedditDataset.get_data_sample
+        :raises RuntimeError: if a csv changes while it is queried
+        """
+
+        if select_by not in {'random', 'score'}:
+            raise ValueError(f'select_by has to be "random" or "score" but not {select_by}.')
+
+        query = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'minimum_number_of_words_per_comment': minimum_number_of_words_per_comment,
+            'must_include_terms': must_include_terms,
+            'must_exclude_terms': must_exclude_terms,
+        }
+        self._load_if_changed()
+        rng = random if seed is None else random.Random(seed)
+        # every shard gets its own seed, drawn from rng, so that the result is reproducible
+        shard_seeds = [rng.getrandbits(32) for _ in self.shards]
+
+        # worker processes already have the excluded rows, see _set_excluded_rows
+        excluded_rows = self._excluded_rows if self._executor is None else \
+            itertools.repeat(None)
+        results = list(self._map(_query_shard, self.dataset_csv_files, self._csv_versions,
+                                 excluded_rows, itertools.repeat(query), itertools.repeat(number_of_comments),
+                                 itertools.repeat(select_by), shard_seeds))
+
+        if select_by == 'score':
+            return [comment.to_dict() for comment in
+                    top_k(itertools.chain.from_iterable(sample for _, sample in results),
+                          number_of_comments, key=lambda comment: comment['score'])]
+
+        # draw positions among the matches of all shards without replacement and take as many
+        # comments from every shard as positions fall into its matches
+        match_offsets = list(itertools.accumulate(number_of_matches
+                                                  for number_of_matches, _ in results))
+        number_of_matches = match_offsets[-1]
+        if number_of_matches <= number_of_comments:
+            taken = [len(shard_sample) for _, shard_sample in results]
+        else:
+            taken = [0] * len(results)
+            for position in rng.sample(range(number_of_matches), number_of_comments):
+                taken[bisect.bisect_right(match_offsets, position)] += 1
+
+        sample = []
+        for (_, shard_sample), number_taken in zip(results, taken):
+            sample += rng.sample(shard_sample, number_taken)
+        return [comment.to_dict() for comment in sample]
+
+    def iter_comments(self, start_date=None, end_date=None):
+        """
+        Yields the comments of all shards in date order, without duplicates. The shards are
+        already sorted by date, so they are combined with a k-way merge instead of a sort.
+
+        :param start_date: str, default: first date
+        :param end_date: str, default: last date
+        :return: generator of dict
+        """
+
+        self._load_if_changed()
+        shards, all_excluded_rows = self.shards, self._excluded_rows
+
+        def iter_shard(shard_index):
+            data = shards[shard_index].data
+            excluded_rows = all_excluded_rows[shard_index]
+            first_code, end_code = data.get_date_code_range(start_date, end_date)
+            for code in range(first_code, end_code):
+                date = data.dates[code]
+                for row in range(data.date_offsets[code], data.date_offsets[code + 1]):
+                    if row not in excluded_rows:
+                        yield date, shard_index, row
+
+        for _, shard_index, row in heapq.merge(*(iter_shard(shard_index)
+                                                 for shard_index in range(len(shards)))):
+            yield shards[shard_index].data[row].to_dict()
+
+    def _find_duplicates(self):
+        """
+        Finds the rows of every shard whose url already appears in an earlier shard or earlier
+        in the same shard.
+
+        A comment has the same date in every shard, so duplicates only need to be looked for
+        among comments of the same date. The dates are split into ranges that are checked in
+        parallel.
+
+        :return: list[set[int]], excluded rows of every shard
+        """
+
+        all_dates = sorted(set(itertools.chain.from_iterable(shard.data.dates
+                                                             for shard in self.shards)))
+        number_of_ranges = min(len(all_dates), self.max_workers * 4) or 1
+        range_size = -(-len(all_dates) // number_of_ranges)
+        date_ranges = [(all_dates[i], all_dates[min(i + range_size, len(all_dates)) - 1])
+                       for i in range(0, len(all_dates), range_size)]
+
+        excluded_rows = [set() for _ in self.shards]
+        for duplicates in self._map(_find_duplicates_in_date_range,
+                                    itertools.repeat(self.dataset_csv_files),
+                                    itertools.repeat(self._csv_versions), date_ranges):
+            for shard_index, rows in enumerate(duplicates):
+                excluded_rows[shard_index].update(rows)
+        return excluded_rows
+
+    def _map(self, function, *iterables):
+        if self._executor is None:
+            return map(function, *iterables)
+        return self._executor.map(function, *iterables)
+
+
+# datasets opened by a worker process, so that every process only maps each shard once.
+# csv file -> (RedditDataset, (size, mtime) of the csv it was loaded from)
+_open_datasets = {}
+# rows of every shard that the queries of a worker process skip, see _set_excluded_rows
+_excluded_rows = {}
+
+
+def _get_csv_version(dataset_csv_file):
+    """
+    :param dataset_csv_file: str
+    :return: (int, int), size and modification time of the csv
+    """
+
+    csv_stat = Path('reddit_data', dataset_csv_file).stat()
+    return csv_stat.st_size, csv_stat.st_mtime_ns
+
+
+def _get_dataset(dataset_csv_file, csv_version):
+    """
+    Returns the dataset of a csv, which is opened again if the csv changed since it was opened
+
+    :param dataset_csv_file: str
+    :param csv_version: (int, int), version of the csv the caller expects, see _get_csv_version
+    :return: RedditDataset
+    :raises RuntimeError: if the csv is not at csv_version, e.g. because it changed during a
+                          query. Rows of different versions must not be mixed
+    """
+
+    if _get_csv_version(dataset_csv_file) != csv_version:
+        raise RuntimeError(f"{dataset_csv_file} changed while it was queried, query again.")
+    if dataset_csv_file in _open_datasets:
+        dataset, dataset_version = _open_datasets[dataset_csv_file]
+        if dataset_version == csv_version:
+            return dataset
+    dataset = RedditDataset(dataset_csv_file)
+    _open_datasets[dataset_csv_file] = (dataset, csv_version)
+    return dataset
+
+
+def _set_excluded_rows(excluded_rows):
+    """
+    Initializer of the worker processes that run queries
+
+    :param excluded_rows: dict, csv file -> set[int], excluded rows of every shard
+    :return:
+    """
+
+    _excluded_rows.update(excluded_rows)
+
+
+def _build_sidecar(dataset_csv_file):
+    load_columnar_comments(Path('reddit_data', dataset_csv_file))
+
+
+def _query_shard(dataset_csv_file, csv_version, excluded_rows, query, number_of_comments,
+                 select_by, seed):
+    """
+    Runs a query on one shard
+
+    :param csv_version: (int, int), version of the csv the excluded rows were found in
+    :param excluded_rows: set[int], rows to skip. None: the rows set by _set_excluded_rows
+    :return: (number of matching comments, list[Comment])
+    """
+
+    if excluded_rows is None:
+        excluded_rows = _excluded_rows[dataset_csv_file]
+    dataset = _get_dataset(dataset_csv_file, csv_version)
+    rows = dataset._find_matching_rows(excluded_rows=excluded_rows, **query)
+
+    # count the matches while they are consumed. zip stops before it draws from the counter
+    # once rows is exhausted, so the next value of the counter is the number of matches
+    counter = itertools.count()
+    rows = map(operator.itemgetter(0), zip(rows, counter))
+    sample = dataset._select(rows, number_of_comments, select_by, seed)
+    return next(counter), [dataset.data[row] for row in sample]
+
+
+def _find_duplicates_in_date_range(dataset_csv_files, csv_versions, date_range):
+    """
+    Finds duplicate urls among the comments of all shards from start to end date of
+    date_range. Merges the dates of all shards and keeps every url in the first shard that
+    has it on that date.
+
+    :param dataset_csv_files: list[str]
+    :param csv_versions: list[(int, int)], version of every csv, see _get_csv_version
+    :param date_range: (str, str), start and end date
+    :return: list[list[int]], duplicate rows of every shard
+    """
+
+    datasets = [_get_dataset(dataset_csv_file, csv_version)
+                for dataset_csv_file, csv_version in zip(dataset_csv_files, csv_versions)]
+    start_date, end_date = date_range
+
+    def iter_dates(shard_index):
+        data = datasets[shard_index].data
+        first_code, end_code = data.get_date_code_range(start_date, end_date)
+        for code in range(first_code, end_code):
+            yield data.dates[code], shard_index, code
+
+    duplicates = [[] for _ in datasets]
+    merged = heapq.merge(*(iter_dates(shard_index) for shard_index in range(len(datasets))))
+    for _, shards_of_date in itertools.groupby(merged, key=operator.itemgetter(0)):
+        seen_urls = set()
+        for _, shard_index, code in shards_of_date:
+            data = datasets[shard_index].data
+            urls = data.string_columns['url']
+            for row in range(data.date_offsets[code], data.date_offsets[code + 1]):
+                url = urls[row]
+                if url == 'n/a':
+                    continue
+                if url in seen_urls:
+                    duplicates[shard_index].append(row)
+                else:
+                    seen_urls.add(url)
+    return duplicates
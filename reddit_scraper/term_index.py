@@ -0,0 +1,298 @@
+import bisect
+import itertools
+import json
+import mmap
+import os
+import re
+import shutil
+from array import array
+from collections import defaultdict
+
+TOKEN_PATTERN = re.compile(r'\b\w\w+\b')
+
+
+def tokenize(text):
+    """
+    Splits a comment into the set of lowercased tokens that must_include_terms and
+    must_exclude_terms are matched against
+
+    >>> sorted(tokenize('Stay home, stay SAFE!'))
+    ['home', 'safe', 'stay']
+
+    :param text: str
+    :return: set[str]
+    """
+
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def matches_terms(tokens, must_include_terms=None, must_exclude_terms=None):
+    """
+    Checks the tokens of a single comment against the term filters of get_data_sample
+
+    :param tokens: set[str], see tokenize
+    :param must_include_terms: list[str]
+    :param must_exclude_terms: list[str]
+    :return: bool
+    """
+
+    return all(term.lower() in tokens for term in must_include_terms or []) and \
+        not any(term.lower() in tokens for term in must_exclude_terms or [])
+
+
+class TermIndex:
+
+    def __init__(self, postings, number_of_rows, mmaps=None):
+        """
+        Inverted index that maps every token to the sorted rows of the comments that contain it.
+
+        Answering must_include_terms / must_exclude_terms with the index only touches the
+        posting lists of the queried terms instead of tokenizing every comment in the date range.
+        Since rows are sorted by date, the rows of a date range are a contiguous slice of every
+        posting list that is found with two bisects.
+
+        A posting list can consist of several parts, e.g. the rows of the stored index and the
+        rows that were added by extend, which are appended in place. Rows of later parts are
+        larger than those of earlier ones.
+
+        :param postings: dict, token -> list of int32 arrays or memoryviews of rows, sorted
+        :param number_of_rows: int, number of rows that are indexed
+        :param mmaps: list of mmap objects backing the posting lists
+        """
+
+        self.postings = postings
+        self.number_of_rows = number_of_rows
+        self._mmaps = mmaps or []
+        # rows and delta segments stored in the index_dir of the last load or save, see save
+        self._stored_dir = None
+        self._stored_rows = None
+        self._number_of_deltas = 0
+        # tokens that got rows since the last save
+        self._changed_tokens = set(postings)
+
+    @classmethod
+    def build(cls, texts):
+        """
+        Tokenizes every text once and builds the index
+
+        :param texts: sequence of str, e.g. a StringColumn
+        :return: TermIndex
+        """
+
+        index = cls({}, 0)
+        index.extend(texts)
+        return index
+
+    def extend(self, texts):
+        """
+        Adds the texts from row number_of_rows on to the index. New rows are always larger than
+        the indexed ones, so they are appended to the last part of every posting list, or
+        added as a new part if that one is read-only. Costs O(new rows).
+
+        :param texts: sequence of str with at least number_of_rows entries
+        :return:
+        """
+
+        new_postings = defaultdict(lambda: array('i'))
+        for row in range(self.number_of_rows, len(texts)):
+            for token in tokenize(texts[row]):
+                new_postings[token].append(row)
+
+        self._changed_tokens.update(new_postings)
+        for token, rows in new_postings.items():
+            parts = self.postings.setdefault(token, [])
+            # posting lists loaded from disk are read-only memoryviews
+            if parts and isinstance(parts[-1], array):
+                parts[-1].extend(rows)
+            else:
+                parts.append(rows)
+        self.number_of_rows = len(texts)
+
+    def get_rows(self, term, first_row=0, end_row=None):
+        """
+        Returns the sorted rows from first_row up to end_row of the comments that contain term
+
+        :param term: str, matched case-insensitively
+        :param first_row: int
+        :param end_row: int, default: all rows
+        :return: sequence of int
+        """
+
+        parts = self.postings.get(term.lower())
+        if not parts:
+            return ()
+        if end_row is None:
+            end_row = self.number_of_rows
+        slices = [rows[bisect.bisect_left(rows, first_row):bisect.bisect_left(rows, end_row)]
+                  for rows in parts
+                  if len(rows) and rows[-1] >= first_row and rows[0] < end_row]
+        if not slices:
+            return ()
+        if len(slices) == 1:
+            return slices[0]
+        rows = array('i')
+        for rows_slice in slices:
+            rows.extend(rows_slice)
+        return rows
+
+    def match(self, first_row, end_row, must_include_terms=None, must_exclude_terms=None):
+        """
+        Yields the rows from first_row up to end_row of all comments that contain all
+        must_include_terms and none of the must_exclude_terms, in ascending order.
+
+        Include terms are intersected starting with the shortest posting list, every candidate
+        is looked up in the other posting lists with a bisect.
+
+        :param first_row: int
+        :param end_row: int
+        :param must_include_terms: list[str]
+        :param must_exclude_terms: list[str]
+        :return: generator of int
+        """
+
+        excluded = [self.get_rows(term, first_row, end_row) for term in must_exclude_terms or []]
+
+        if must_include_terms:
+            included = sorted((self.get_rows(term, first_row, end_row)
+                               for term in must_include_terms), key=len)
+            candidates, required = included[0], included[1:]
+        else:
+            candidates, required = range(first_row, end_row), []
+            # without include terms, nearly every row is a candidate. a set is faster then
+            excluded = [set(rows) for rows in excluded]
+
+        for row in candidates:
+            if all(_contains(rows, row) for rows in required) and \
+                    not any(_contains(rows, row) for rows in excluded):
+                yield row
+
+    def save(self, index_dir):
+        """
+        Stores the index in index_dir.
+
+        If index_dir holds this index as of an earlier load or save, only the rows that were
+        added since then are written, as a delta segment with its own vocabulary and posting
+        file, so storing an append costs O(new rows). Once there are MAX_DELTA_SEGMENTS delta
+        segments, or for a new index, everything is written as one segment to a temporary
+        directory that replaces index_dir at the end.
+
+        :param index_dir: Path
+        :return:
+        """
+
+        if self._stored_dir == index_dir and self._stored_rows is not None and \
+                self._number_of_deltas < MAX_DELTA_SEGMENTS and index_dir.exists():
+            if self.number_of_rows > self._stored_rows:
+                self._number_of_deltas += 1
+                _write_segment(index_dir, f'delta_{self._number_of_deltas}', self.postings,
+                               self._changed_tokens, self._stored_rows, self.number_of_rows)
+                self._stored_rows = self.number_of_rows
+                self._changed_tokens = set()
+            return
+
+        tmp_dir = index_dir.with_name(f'{index_dir.name}.{os.getpid()}.tmp')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        _write_segment(tmp_dir, 'base', self.postings, self.postings, 0, self.number_of_rows)
+
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(tmp_dir, index_dir)
+        self._stored_dir = index_dir
+        self._stored_rows = self.number_of_rows
+        self._number_of_deltas = 0
+        self._changed_tokens = set()
+
+    @classmethod
+    def load(cls, index_dir):
+        """
+        Loads the vocabularies and memory-maps the posting lists of all segments
+
+        :param index_dir: Path
+        :return: TermIndex
+        """
+
+        postings = defaultdict(list)
+        mmaps = []
+        number_of_rows = 0
+        number_of_deltas = 0
+        for name in itertools.chain(['base'], (f'delta_{i}' for i in itertools.count(1))):
+            if not (index_dir / f'{name}.json').exists():
+                break
+            with open(index_dir / f'{name}.json') as infile:
+                stored = json.load(infile)
+            # a delta of an older version of the index that was not cleaned up
+            if stored['first_row'] != number_of_rows:
+                break
+
+            with open(index_dir / f'{name}.i32', 'rb') as infile:
+                if os.fstat(infile.fileno()).st_size > 0:
+                    mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                    mmaps.append(mapped)
+                    all_rows = memoryview(mapped).cast('i')
+                    for token, (position, length) in stored['vocabulary'].items():
+                        postings[token].append(all_rows[position:position + length])
+            number_of_rows = stored['rows']
+            if name != 'base':
+                number_of_deltas += 1
+
+        index = cls(dict(postings), number_of_rows, mmaps=mmaps)
+        index._stored_dir = index_dir
+        index._stored_rows = number_of_rows
+        index._number_of_deltas = number_of_deltas
+        index._changed_tokens = set()
+        return index
+
+
+# number of delta segments that save writes before it merges all segments into one
+MAX_DELTA_SEGMENTS = 32
+
+
+def _write_segment(index_dir, name, postings, tokens, first_row, end_row):
+    """
+    Stores the rows from first_row up to end_row of all posting lists as a json vocabulary
+    with the position of every posting list and one int32 file with all posting lists. The
+    vocabulary is written last, so a segment without it is ignored by TermIndex.load.
+
+    :param index_dir: Path
+    :param name: str, file name of the segment without suffix, e.g. 'base' or 'delta_1'
+    :param postings: dict, token -> list of parts, see TermIndex
+    :param tokens: iterable of str, the tokens that can have rows from first_row on
+    :param first_row: int
+    :param end_row: int
+    :return:
+    """
+
+    vocabulary = {}
+    position = 0
+    with open(index_dir / f'{name}.i32', 'wb') as outfile:
+        for token in tokens:
+            parts = postings[token]
+            length = 0
+            # only the last parts can hold rows from first_row on
+            for rows in parts:
+                if len(rows) and rows[-1] >= first_row:
+                    rows = rows[bisect.bisect_left(rows, first_row):
+                                bisect.bisect_left(rows, end_row)]
+                    outfile.write(memoryview(rows).cast('B'))
+                    length += len(rows)
+            if length:
+                vocabulary[token] = [position, length]
+                position += length
+
+    tmp_path = index_dir / f'{name}.json.tmp'
+    with open(tmp_path, 'w') as outfile:
+        json.dump({'first_row': first_row, 'rows': end_row, 'vocabulary': vocabulary}, outfile)
+    os.replace(tmp_path, index_dir / f'{name}.json')
+
+
+def _contains(rows, row):
+    """
+    :param rows: sorted sequence of int, or a set
+    :param row: int
+    :return: bool
+    """
+
+    if isinstance(rows, set):
+        return row in rows
+    i = bisect.bisect_left(rows, row)
+    return i < len(rows) and rows[i] == row
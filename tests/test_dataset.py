@@ -0,0 +1,222 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'reddit_scraper'))
+
+from columnar import FIELDNAMES, get_sidecar_dir
+from term_index import MAX_DELTA_SEGMENTS
+from dataset import RedditDataset
+from sharded_dataset import ShardedRedditDataset
+
+WORDS = ['virus', 'mask', 'lockdown', 'vaccine', 'hospital', 'test', 'news', 'home']
+
+
+def make_rows(dates, comments_per_day=20, first_id=0):
+    rows = []
+    for date in dates:
+        for i in range(comments_per_day):
+            n = first_id + len(rows)
+            # 4 of the words, repeated to 12 words
+            text = ' '.join([WORDS[(n // 3 + k) % len(WORDS)] for k in range(4)] * 3)
+            rows.append({'date': date, 'author': f'author{n % 7}', 'subreddit': 'Coronavirus',
+                         'score': n % 50, 'url': f'https://www.reddit.com/r/Coronavirus/c{n}/',
+                         'text': text})
+    return rows
+
+
+def write_csv(path, rows, header=True):
+    with open(path, 'a', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=FIELDNAMES)
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+class DatasetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # datasets are read from reddit_data in the working directory
+        working_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(working_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(working_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        Path('reddit_data').mkdir()
+        write_csv(Path('reddit_data', 'comments.csv'),
+                  make_rows(['2020-03-01', '2020-03-02', '2020-03-03']))
+
+
+class DataSampleTest(DatasetTestCase):
+
+    def test_samples_are_plain_dicts(self):
+        dataset = RedditDataset('comments.csv')
+        for lazy_dataset in (dataset, RedditDataset('comments.csv', lazy=True),
+                             RedditDataset('comments.csv', lazy=True, use_columnar_cache=False)):
+            sample = lazy_dataset.get_data_sample(start_date='2020-03-01',
+                                                  end_date='2020-03-03', number_of_comments=5,
+                                                  select_by='score')
+            self.assertEqual(len(sample), 5)
+            self.assertTrue(all(type(comment) is dict for comment in sample))
+            self.assertEqual(json.loads(json.dumps(sample)), sample)
+
+    def test_changing_a_sample_does_not_change_the_cache(self):
+        dataset = RedditDataset('comments.csv')
+        query = {'start_date': '2020-03-01', 'end_date': '2020-03-03', 'number_of_comments': 5,
+                 'seed': 1}
+
+        sample = dataset.get_data_sample(**query)
+        expected = [comment.copy() for comment in sample]
+        sample[0]['text'] = 'changed'
+        sample.pop()
+
+        self.assertEqual(dataset.get_data_sample(**query), expected)
+        self.assertEqual(dataset.query_cache.hits, 1)
+
+
+class AppendTest(DatasetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.days = [str(date(2020, 3, 4) + timedelta(days=i))
+                     for i in range(MAX_DELTA_SEGMENTS + 3)]
+        for i, day in enumerate(self.days):
+            write_csv(Path('reddit_data', f'{day}.csv'),
+                      make_rows([day], first_id=1000 * (i + 1)))
+
+    @staticmethod
+    def query(dataset):
+        sample = dataset.get_data_sample(start_date='2020-03-01', end_date='2020-12-31',
+                                         must_include_terms=['mask'],
+                                         must_exclude_terms=['vaccine'])
+        return (sorted(comment['url'] for comment in sample),
+                dataset.count_comments('2020-03-01', '2020-12-31', frequency='week'),
+                dataset.count_term_mentions(['virus', 'home'], '2020-03-01', '2020-12-31'))
+
+    def assert_matches_csv(self, dataset):
+        expected = self.query(RedditDataset('comments.csv', use_columnar_cache=False))
+        self.assertEqual(self.query(dataset), expected)
+        # the appended sidecar and term index, loaded from disk
+        self.assertEqual(self.query(RedditDataset('comments.csv')), expected)
+
+    def test_append_days(self):
+        dataset = RedditDataset('comments.csv')
+        # cached results and the persisted term index are updated by the appends
+        self.query(dataset)
+
+        # more appends than delta segments, so the term index is compacted once
+        for day in self.days:
+            self.assertEqual(dataset.append_days([f'{day}.csv']), 20)
+        self.assertEqual(dataset.append_days([f'{self.days[-1]}.csv']), 0)
+
+        self.assertEqual(dataset.get_watermark(), self.days[-1])
+        self.assert_matches_csv(dataset)
+
+    def test_refresh_after_another_process_appended(self):
+        dataset = RedditDataset('comments.csv')
+        self.query(dataset)
+        reddit_scraper_dir = Path(__file__).resolve().parents[1] / 'reddit_scraper'
+        script = ('import sys; from dataset import RedditDataset; '
+                  'dataset = RedditDataset("comments.csv"); dataset.get_term_index(); '
+                  'dataset.append_days(sys.argv[1:])')
+
+        subprocess.run([sys.executable, '-c', script] + [f'{day}.csv' for day in self.days[:3]],
+                       cwd=os.getcwd(), env=dict(os.environ, PYTHONPATH=str(reddit_scraper_dir)),
+                       check=True, stdout=subprocess.DEVNULL)
+        # the sidecar already has the comments, they are mapped instead of appended again
+        scores_path = get_sidecar_dir(Path('reddit_data', 'comments.csv')) / 'scores.i64'
+        scores_mtime = scores_path.stat().st_mtime_ns
+        self.assertEqual(dataset.refresh(), 60)
+        self.assertEqual(scores_path.stat().st_mtime_ns, scores_mtime)
+        self.assert_matches_csv(dataset)
+
+        # a scraper that continues the csv only appends to the csv itself
+        with open(Path('reddit_data', f'{self.days[3]}.csv')) as infile:
+            write_csv(Path('reddit_data', 'comments.csv'), csv.DictReader(infile), header=False)
+        self.assertEqual(dataset.refresh(), 20)
+        self.assertEqual(dataset.refresh(), 0)
+        self.assert_matches_csv(dataset)
+
+
+class ColumnFileTest(DatasetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.expected = self.query(RedditDataset('comments.csv', use_columnar_cache=False))
+        self.sidecar_dir = get_sidecar_dir(Path('reddit_data', 'comments.csv'))
+
+    @staticmethod
+    def query(dataset):
+        return (dataset.get_data_sample(start_date='2020-03-01', end_date='2020-03-03',
+                                        number_of_comments=100, select_by='score'),
+                dataset.count_comments('2020-03-01', '2020-03-03'))
+
+    def test_extra_bytes_after_the_columns_are_ignored(self):
+        RedditDataset('comments.csv')
+        # e.g. an append that crashed after writing part of a value
+        for name in ('scores.i64', 'date_codes.i32', 'text.offsets.i64', 'text.blob'):
+            with open(self.sidecar_dir / name, 'ab') as outfile:
+                outfile.write(b'\x01\x02\x03')
+
+        self.assertEqual(self.query(RedditDataset('comments.csv')), self.expected)
+        self.assertEqual(self.query(RedditDataset('comments.csv', lazy=True)), self.expected)
+
+    def test_truncated_column_is_rebuilt(self):
+        RedditDataset('comments.csv')
+        for name in ('word_counts.i32', 'url.blob'):
+            path = self.sidecar_dir / name
+            with open(path, 'r+b') as outfile:
+                outfile.truncate(path.stat().st_size - 5)
+
+        self.assertEqual(self.query(RedditDataset('comments.csv')), self.expected)
+        # the rebuilt sidecar is complete again
+        self.assertEqual(self.query(RedditDataset('comments.csv', lazy=True)), self.expected)
+
+
+class ShardedDatasetTest(DatasetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # the second shard repeats the comments of 2020-03-02
+        write_csv(Path('reddit_data', 'comments_2.csv'),
+                  make_rows(['2020-03-02'], first_id=20) + make_rows(['2020-03-04'], first_id=1000))
+
+    def assert_no_duplicates(self, dataset):
+        urls = set()
+        for name in dataset.dataset_csv_files:
+            with open(Path('reddit_data', name)) as infile:
+                urls.update(row['url'] for row in csv.DictReader(infile))
+        sample = dataset.get_data_sample(start_date='2020-01-01', end_date='2020-12-31')
+        self.assertEqual(sorted(comment['url'] for comment in sample), sorted(urls))
+        self.assertEqual(sorted(comment['url'] for comment in dataset.iter_comments()),
+                         sorted(urls))
+        self.assertEqual(len(dataset), len(urls))
+
+    def test_changed_shard_is_deduplicated_again(self):
+        self.check_changed_shard(max_workers=1)
+
+    def test_workers_get_the_rows_of_a_changed_shard(self):
+        self.check_changed_shard(max_workers=2)
+
+    def check_changed_shard(self, max_workers):
+        dataset = ShardedRedditDataset('comments*.csv', max_workers=max_workers)
+        self.addCleanup(dataset.close)
+        self.assert_no_duplicates(dataset)
+
+        # new comments before the duplicates move all of their rows
+        path = Path('reddit_data', 'comments_2.csv')
+        path.unlink()
+        write_csv(path, make_rows(['2020-03-01'], first_id=2000) +
+                  make_rows(['2020-03-02'], first_id=20) + make_rows(['2020-03-04'], first_id=1000))
+
+        self.assert_no_duplicates(dataset)
+
+
+if __name__ == '__main__':
+    unittest.main()
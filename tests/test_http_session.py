@@ -0,0 +1,69 @@
+import sys
+import threading
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'reddit_scraper'))
+
+from http_session import HttpSession
+
+# path -> (status, headers, body)
+RESPONSES = {
+    '/data': (200, {}, b'data'),
+    '/moved': (301, {'Location': '/data'}, b''),
+    '/temporary': (307, {'Location': 'moved'}, b''),
+    '/loop': (302, {'Location': '/loop'}, b''),
+    '/not-modified': (304, {}, b''),
+}
+
+
+class HttpSessionTest(unittest.TestCase):
+
+    def setUp(self):
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, headers, body = RESPONSES.get(self.path, (404, {}, b'not found'))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        self.session = HttpSession(max_redirects=3)
+        self.addCleanup(self.session.close)
+
+    def test_redirects_are_followed(self):
+        self.assertEqual(self.session.get(f'{self.base_url}/moved'), b'data')
+        self.assertEqual(self.session.get(f'{self.base_url}/temporary'), b'data')
+
+    def test_redirect_loop_raises(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.session.get(f'{self.base_url}/loop')
+        self.assertEqual(context.exception.code, 302)
+
+    def test_statuses_outside_of_2xx_raise(self):
+        for path, code in (('/missing', 404), ('/not-modified', 304)):
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.session.get(f'{self.base_url}{path}')
+            self.assertEqual(context.exception.code, code)
+        # the connections are still usable afterwards
+        self.assertEqual(self.session.get(f'{self.base_url}/data'), b'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
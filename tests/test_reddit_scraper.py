@@ -0,0 +1,158 @@
+import json
+import sys
+import threading
+import time
+import unittest
+import urllib.parse
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'reddit_scraper'))
+
+from reddit_scraper import HOT_DAY_WINDOW_SECONDS, RedditScraper
+
+DAY = date(2020, 3, 1)
+
+
+class FakePushshift:
+
+    def __init__(self, documents, delay=0):
+        """
+        Local stand-in for the pushshift.io search endpoint. after and before are exclusive,
+        results are sorted by created_utc, newest first.
+
+        :param documents: list[dict], raw pushshift.io documents
+        :param delay: float, seconds every response takes
+        """
+
+        self.documents = sorted(documents, key=lambda doc: doc['created_utc'], reverse=True)
+        self.number_of_requests = 0
+        self.requests_in_flight = 0
+        self.max_requests_in_flight = 0
+        lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                with lock:
+                    fake.number_of_requests += 1
+                    fake.requests_in_flight += 1
+                    fake.max_requests_in_flight = max(fake.max_requests_in_flight,
+                                                      fake.requests_in_flight)
+                time.sleep(delay)
+                with lock:
+                    fake.requests_in_flight -= 1
+                after, before = int(query['after']), int(query['before'])
+                data = [doc for doc in fake.documents
+                        if after < doc['created_utc'] < before][:int(query['size'])]
+                body = json.dumps({'data': data}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_document(i, created_utc):
+    return {'id': f'c{i}', 'created_utc': created_utc, 'author': f'author{i}',
+            'subreddit': 'Coronavirus', 'score': i % 50, 'permalink': f'/r/Coronavirus/c{i}/',
+            'body': f'comment {i}'}
+
+
+class HotDayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.after, self.before = RedditScraper._get_timestamp_window(DAY, date(2020, 3, 2))
+        # one comment every 17 seconds, 5000 over the day
+        self.documents = [make_document(i, self.before - 1 - 17 * i) for i in range(5000)]
+
+    def fetch_day(self, documents, **kwargs):
+        fake = FakePushshift(documents)
+        self.addCleanup(fake.close)
+        scraper = RedditScraper(subreddit='Coronavirus', start_date='2020-03-01',
+                                end_date='2020-03-01', sort_by='created_utc',
+                                requests_per_second=1000, base_url=fake.base_url,
+                                **dict({'max_concurrent_requests': 4}, **kwargs))
+        days = list(scraper._fetch_days_in_order([DAY]))
+        return days[0][1], fake
+
+    def test_comments_on_window_boundaries_are_fetched(self):
+        page_size = 100
+        oldest_on_first_page = self.documents[page_size - 1]['created_utc']
+        boundary_documents = [
+            make_document(10000 + k, end)
+            for k, end in enumerate(range(oldest_on_first_page + 1 - HOT_DAY_WINDOW_SECONDS,
+                                          self.after, -HOT_DAY_WINDOW_SECONDS))]
+        self.assertGreater(len(boundary_documents), 20)
+
+        documents, _ = self.fetch_day(self.documents + boundary_documents,
+                                      number_of_results_per_day=100000, page_size=page_size)
+
+        ids = {doc['id'] for doc in documents}
+        self.assertEqual(len(ids), len(documents))
+        self.assertEqual(len(documents), len(self.documents) + len(boundary_documents))
+        self.assertTrue(all(doc['id'] in ids for doc in boundary_documents))
+
+    def test_windows_stop_at_the_day_limit(self):
+        documents, fake = self.fetch_day(self.documents, number_of_results_per_day=1000,
+                                         page_size=100)
+
+        self.assertEqual(len(documents), 1000)
+        # serial pagination needs 10 requests, windows that run ahead may add a few more
+        self.assertLess(fake.number_of_requests, 30)
+
+    def test_days_and_windows_share_the_concurrency_cap(self):
+        days = [date(2020, 3, day) for day in range(1, 9)]
+        documents = []
+        for day in days:
+            after, before = RedditScraper._get_timestamp_window(day, day.replace(day=day.day + 1))
+            documents += [make_document(len(documents) + i, before - 1 - 150 * i)
+                          for i in range(400)]
+        fake = FakePushshift(documents, delay=0.01)
+        self.addCleanup(fake.close)
+        scraper = RedditScraper(subreddit='Coronavirus', start_date='2020-03-01',
+                                end_date='2020-03-08', sort_by='created_utc',
+                                number_of_results_per_day=100000, page_size=10,
+                                max_concurrent_requests=2, requests_per_second=1000,
+                                base_url=fake.base_url)
+
+        fetched = dict(scraper._fetch_days_in_order(days))
+
+        self.assertEqual(sum(map(len, fetched.values())), len(documents))
+        self.assertLessEqual(fake.max_requests_in_flight, 2)
+
+    def test_limit_smaller_than_a_busy_second(self):
+        # 30 comments in every second, so every page ends in a partly downloaded second
+        documents = [make_document(i, self.before - 1 - i // 30) for i in range(3000)]
+
+        documents, _ = self.fetch_day(documents, number_of_results_per_day=1000, page_size=100,
+                                      max_concurrent_requests=1)
+
+        self.assertEqual(len({doc['id'] for doc in documents}), 1000)
+
+    def test_score_order_is_a_single_request(self):
+        fake = FakePushshift(self.documents)
+        self.addCleanup(fake.close)
+        scraper = RedditScraper(subreddit='Coronavirus', start_date='2020-03-01',
+                                end_date='2020-03-01', number_of_results_per_day=1000,
+                                page_size=100, base_url=fake.base_url, requests_per_second=1000)
+        list(scraper._fetch_days_in_order([DAY]))
+        self.assertEqual(fake.number_of_requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,14 @@
 
 import tweepy
 import datetime
-import csv, codecs, cStringIO
+import functools
+import gzip
+import io
+import json
+import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
+import csv
 from dateutil import parser
 
 
@@ -10,64 +17,157 @@ CONSUMER_SECRET = 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
 ACCESS_TOKEN = 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
 ACCESS_TOKEN_SECRET = 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
 
+TWEET_FIELDNAMES = ['tweet_id', 'date', 'author_id', 'author_name', 'author_screen_name',
+                    'is_retweet', 'retweets_number', 'text']
 
-def scrape_term(term, max_tweets=10000000, start_date='2016-01-01', end_date='2017-01-01'):
+
+def scrape_term(term, max_tweets=10000000, start_date='2016-01-01', end_date='2017-01-01', api=None,
+                stats=None):
     '''
     This function scrapes up to max_tweets mentioning a particular term
     :param term: a search term that each scraped tweet needs to contain
     :param max_tweets: the maximum number of tweets to scrape
     :param start_date: the earliest date from which to scrape. note: this param is mostly used by scrape_term_by_day
     :param end_date: the last date from which to scrape. note: this param is mostly used by scrape_term_by_day
+    :param api: an authenticated tweepy api to reuse. If None, a new one is set up with set_up_twitter_api
+    :param stats: records the time spent waiting for twitter, including rate limit waits, as
+        'twitter.search' and the number of tweets as 'twitter.tweets_scraped'. An object with
+        increment(name, value) and add_time(name, seconds) methods, e.g. the Stats class in
+        reddit_scraper/instrumentation.py. Default: nothing is recorded
     :return A list of tweet dicts. Each dict represents a tweet and has the following keys:
         'tweet_id', 'date', 'text', 'author_id', 'author_name', 'author_screen_name', 'is_retweet', 'retweets_number'
     '''
 
-    api = set_up_twitter_api()
-    tweets = []
+    return list(iter_term(term, max_tweets, start_date, end_date, api, stats))
+
+def iter_term(term, max_tweets=10000000, start_date='2016-01-01', end_date='2017-01-01', api=None,
+              stats=None):
+    '''
+    Like scrape_term, but yields the tweet dicts one at a time as they are scraped instead of
+    collecting them in a list first
+    :return A generator of tweet dicts, see scrape_term
+    '''
 
-    for c, tweet in enumerate(tweepy.Cursor(api.search,
-                                            q=term,
-                                            rpp=100,
-                                            since=start_date,
-                                            until=end_date).items(max_tweets)):
+    if api is None:
+        api = set_up_twitter_api()
+
+    tweets = tweepy.Cursor(api.search,
+                           q=term,
+                           rpp=100,
+                           since=start_date,
+                           until=end_date).items(max_tweets)
+    if stats is not None:
+        tweets = _time_iteration(tweets, stats, 'twitter.search', 'twitter.tweets_scraped')
+
+    for c, tweet in enumerate(tweets):
 
         if (c+1) %100 == 0:
             print("{} tweets mentioning {} scraped.".format(c+1, term))
 
-        tweets.append(tweet_to_dict(tweet))
+        yield tweet_to_dict(tweet)
 
-    return tweets
+def scrape_term_to_file(term, filename, max_tweets=10000000, start_date='2016-01-01',
+                        end_date='2017-01-01', api=None, file_format=None, stats=None):
+    '''
+    This function scrapes up to max_tweets mentioning a particular term straight into a file.
+    Every tweet is written as soon as it is scraped, so memory use stays the same no matter
+    how many tweets are scraped
+    :param term: a search term that each scraped tweet needs to contain
+    :param filename: the name of the file that you want to create, see TweetWriter
+    :param max_tweets: the maximum number of tweets to scrape
+    :param start_date: the earliest date from which to scrape
+    :param end_date: the last date from which to scrape
+    :param api: an authenticated tweepy api to reuse
+    :param file_format: "csv" or "ndjson", see TweetWriter
+    :param stats: records scraping and writing times, see scrape_term and TweetWriter
+    :return The number of stored tweets
+    '''
+
+    with TweetWriter(filename, file_format=file_format, stats=stats) as writer:
+        return writer.write_tweets(iter_term(term, max_tweets, start_date, end_date, api, stats))
 
-def scrape_term_by_day(term, start_date='2016-09-06', end_date='2016-09-17', tweets_per_day=100):
+def _time_iteration(iterable, stats, timer_name, counter_name, batch_size=100):
+    '''
+    Yields the items of iterable and records the time spent waiting for them. The time is
+    added to stats once per batch_size items, not for every item
+    '''
+
+    seconds = 0.0
+    count = 0
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            seconds += time.perf_counter() - start
+        count += 1
+        if count == batch_size:
+            stats.add_time(timer_name, seconds)
+            stats.increment(counter_name, count)
+            seconds = 0.0
+            count = 0
+        yield item
+
+    stats.add_time(timer_name, seconds)
+    stats.increment(counter_name, count)
+
+def scrape_term_by_day(term, start_date='2016-09-06', end_date='2016-09-17', tweets_per_day=100,
+                       max_workers=1, scrape=None, stats=None):
     '''
     This function scrapes up to tweets_per_day tweets for each day between start_date and end_date
     Note: Twitter only allows searches for the last 10 days. Hence, start_date will usually be 10
     days ago and end_date will be today
+
+    All days share one authenticated api. With max_workers > 1, several days are scraped at the
+    same time. The api waits whenever the rate limit is reached, so the threads never exceed it.
+    Tweets that were found for more than one day, e.g. at the day boundaries, are only kept once.
+
     :param term: a search term that each scraped tweet needs to contain
     :param tweets_per_day: maximum number of tweets to scrape for each day
     :param start_date: format: "YYYY-MM-DD", usually set to 10 days ago
     :param end_date: format: "YYYY-MM-DD", usually set to today
-    :return A list of tweet dicts. Each dict represents a tweet and has the following keys:
+    :param max_workers: number of days to scrape at the same time
+    :param scrape: function that scrapes the tweets of one day, with the same parameters as scrape_term
+        (term, max_tweets, start_date, end_date). Default: scrape_term with a single shared api.
+        Pass a different function, e.g. to test against a fake twitter api
+    :param stats: records the time spent waiting for twitter and the number of scraped tweets of
+        all days, see scrape_term. Only used by the default scrape. Default: nothing is recorded
+    :return A list of tweet dicts, sorted by day. Each dict represents a tweet and has the following keys:
         'tweet_id', 'date', 'text', 'author_id', 'author_name', 'author_screen_name', 'is_retweet', 'retweets_number'
     '''
 
-    dt_start = parser.parse(start_date)
-    dt_end = parser.parse(end_date)
+    if scrape is None:
+        scrape = functools.partial(scrape_term, api=set_up_twitter_api(), stats=stats)
 
-    tweets = []
-    while(dt_start <= dt_end):
+    day = parser.parse(start_date).date()
+    last_day = parser.parse(end_date).date()
+    days = []
+    while day <= last_day:
+        days.append(day)
+        day += datetime.timedelta(days=1)
 
-        date_string_start = "{}-{}-{}".format(dt_start.year, dt_start.month, dt_start.day)
-        date_string_end = "{}-{}-{}".format(dt_start.year, dt_start.month, dt_start.day+1)
-        tweets_of_date = scrape_term(term,
-                                      max_tweets=tweets_per_day,
-                                      start_date=date_string_start,
-                                      end_date=date_string_end)
+    def scrape_day(day):
+        # timedelta also gets the day after the last day of a month right
+        return scrape(term,
+                      max_tweets=tweets_per_day,
+                      start_date=day.isoformat(),
+                      end_date=(day + datetime.timedelta(days=1)).isoformat())
 
-        print("Scraped {} tweets mentioning {} from {}".format(len(tweets_of_date), term,
-                                                               date_string_start))
-        tweets = tweets + tweets_of_date
-        dt_start += datetime.timedelta(days=1)
+    tweets = []
+    tweet_ids = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map returns the days in order, no matter which one finishes first
+        for day, tweets_of_date in zip(days, executor.map(scrape_day, days)):
+
+            print("Scraped {} tweets mentioning {} from {}".format(len(tweets_of_date), term,
+                                                                   day.isoformat()))
+            for tweet in tweets_of_date:
+                if tweet['tweet_id'] not in tweet_ids:
+                    tweet_ids.add(tweet['tweet_id'])
+                    tweets.append(tweet)
 
     return tweets
 
@@ -77,23 +177,117 @@ def store_tweets_to_csv(tweets, filename='scraped_tweets.csv'):
     '''
     This function stores a list of tweets (produced by scrape_term or scrape_term_by_day)
     in a csv file
-    :param tweets: a list of tweets produced by scrape_term or scrape_term_by_day
-    :param filename: the name of the csv file that you want to create. can also be a path
+    :param tweets: a list of tweets produced by scrape_term or scrape_term_by_day, or any
+        other iterable of tweet dicts, e.g. from iter_term
+    :param filename: the name of the csv file that you want to create. can also be a path.
+        If it ends with .gz, the csv is gzip compressed
     :return Nothing, but creates a csv of a list of tweets
     '''
 
-    print("Storing {} tweets in {}".format(len(tweets), filename))
+    with TweetWriter(filename, file_format='csv') as writer:
+        number_of_tweets = writer.write_tweets(tweets)
+    print("Stored {} tweets in {}".format(number_of_tweets, filename))
+
+
+class TweetWriter:
+    '''
+    Writes tweet dicts to a csv or a newline-delimited json file (one json object per line),
+    optionally gzip compressed.
 
-    with open(filename, 'wb') as csvfile:
-        csvwriter = UnicodeWriter(csvfile)
-        csvwriter.writerow(['tweet_id', 'date', 'author_id', 'author_name', 'author_screen_name',
-                            'is_retweet', 'retweets_number', 'text'])
+    Rows are written to a large text buffer that encodes every row to utf-8 once and writes
+    the encoded rows to disk in big batches. Nothing else is kept, so a writer can take
+    millions of tweets with constant memory.
+
+    with TweetWriter('trump.csv.gz') as writer:
+        writer.write_tweets(iter_term('@realdonaldtrump'))
+    '''
+
+    def __init__(self, filename, file_format=None, compress=None, buffer_size=1 << 20, stats=None):
+        '''
+        :param filename: the name of the file that you want to create. can also be a path
+        :param file_format: "csv" or "ndjson". Default: "ndjson" if filename ends with .ndjson
+            or .ndjson.gz, otherwise "csv"
+        :param compress: gzip compress the file. Default: if filename ends with .gz
+        :param buffer_size: number of bytes that are collected before they are written
+        :param stats: records the time spent writing as 'twitter.write' and the number of
+            written tweets as 'twitter.rows_written' when the writer is closed, see scrape_term
+        '''
+
+        filename = str(filename)
+        name = filename[:-3] if filename.endswith('.gz') else filename
+        if file_format is None:
+            file_format = 'ndjson' if name.endswith('.ndjson') else 'csv'
+        if file_format not in {'csv', 'ndjson'}:
+            raise ValueError('file_format has to be "csv" or "ndjson" but not {}.'.format(file_format))
+        if compress is None:
+            compress = filename.endswith('.gz')
+
+        self.filename = filename
+        self.file_format = file_format
+        self.number_of_tweets = 0
+        self.stats = stats
+        self._write_seconds = 0.0
+
+        self._raw_file = open(filename, 'wb')
+        binary_file = self._raw_file
+        if compress:
+            binary_file = gzip.GzipFile(fileobj=self._raw_file, mode='wb', compresslevel=6)
+        self._file = io.TextIOWrapper(io.BufferedWriter(binary_file, buffer_size),
+                                      encoding='utf-8', newline='')
+
+        if file_format == 'csv':
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(TWEET_FIELDNAMES)
+            self._get_row = operator.itemgetter(*TWEET_FIELDNAMES)
+
+    def write(self, tweet):
+        '''
+        Writes a single tweet dict
+        '''
+
+        if self.stats is not None:
+            start = time.perf_counter()
+            self._write(tweet)
+            self._write_seconds += time.perf_counter() - start
+        else:
+            self._write(tweet)
+        self.number_of_tweets += 1
+
+    def _write(self, tweet):
+        if self.file_format == 'csv':
+            self._csv_writer.writerow(self._get_row(tweet))
+        else:
+            self._file.write(json.dumps(tweet, ensure_ascii=False))
+            self._file.write('\n')
+
+    def write_tweets(self, tweets):
+        '''
+        Writes all tweet dicts of an iterable, e.g. a generator from iter_term
+        :return The number of written tweets
+        '''
+
+        number_of_tweets = self.number_of_tweets
         for tweet in tweets:
-            try:
-                csvwriter.writerow([tweet['tweet_id'], tweet['date'], tweet['author_id'], tweet['author_name'],
-                                tweet['author_screen_name'], tweet['is_retweet'], tweet['retweets_number'], tweet['text']])
-            except AttributeError as e:
-                print("err", e, tweet)
+            self.write(tweet)
+        return self.number_of_tweets - number_of_tweets
+
+    def close(self):
+        '''
+        Writes everything that is still buffered and closes the file
+        '''
+
+        start = time.perf_counter()
+        self._file.close()
+        self._raw_file.close()
+        if self.stats is not None:
+            self.stats.add_time('twitter.write', self._write_seconds + time.perf_counter() - start)
+            self.stats.increment('twitter.rows_written', self.number_of_tweets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def set_up_twitter_api():
@@ -140,37 +334,6 @@ def tweet_to_dict(tweet):
     }
     return tweet_dict
 
-class UnicodeWriter:
-    """
-    A CSV writer which will write rows to CSV file "f",
-    which is encoded in the given encoding.
-    Copied from https://docs.python.org/2/library/csv.html
-    """
-
-    def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
-        # Redirect output to a queue
-        self.queue = cStringIO.StringIO()
-        self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
-        self.stream = f
-        self.encoder = codecs.getincrementalencoder(encoding)()
-
-    def writerow(self, row):
-        self.writer.writerow([s.encode("utf-8") for s in row])
-        # Fetch UTF-8 output from the queue ...
-        data = self.queue.getvalue()
-        data = data.decode("utf-8")
-        # ... and reencode it into the target encoding
-        data = self.encoder.encode(data)
-        # write to the target stream
-        self.stream.write(data)
-        # empty queue
-        self.queue.truncate(0)
-
-    def writerows(self, rows):
-        for row in rows:
-            self.writerow(row)
-
-
 def tutorial():
 
     ###############################################
@@ -197,10 +360,23 @@ def tutorial():
                                 end_date = '2016-09-16',
                                 tweets_per_day=100)
 
+    # To scrape several days at the same time, pass max_workers.
+    # All days share one api, which waits whenever the rate limit is reached.
+    tweets_4 = scrape_term_by_day('@realdonaldtrump',
+                                start_date='2016-09-06',
+                                end_date = '2016-09-16',
+                                tweets_per_day=100,
+                                max_workers=4)
+
     # To store a collection of tweets, pass the list and a filename
     # to store_tweets_to_csv:
     store_tweets_to_csv(tweets_3, 'trump.csv')
 
+    # To scrape a large number of tweets, write them to a file while they
+    # are scraped instead of keeping them in a list. Files ending with .gz
+    # are compressed, files ending with .ndjson get one json object per line
+    scrape_term_to_file('@realdonaldtrump', 'trump.csv.gz', max_tweets=1000000)
+
 if __name__=='__main__':
 
     tutorial()